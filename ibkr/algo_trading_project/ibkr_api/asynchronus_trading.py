@@ -3,6 +3,8 @@ import logging
 import math
 import asyncio
 
+from order_helpers import wait_for_fill
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -37,52 +39,37 @@ class TradeManager:
         initial_order = MarketOrder(initial_action, share_size)
         trade = self.ib.placeOrder(stock, initial_order)
 
-        # Wait for the trade to fill using event-driven approach
-        fill_future = asyncio.Future()
-
-        def on_execution(trade, fill):
-            if not fill_future.done() and trade.orderStatus.status == "Filled":
-                fill_future.set_result((trade, fill))
-
-        # Register temporary callback for this specific trade
-        self.ib.execDetailsEvent += on_execution
-
-        try:
-            # Wait for order to fill with timeout
-            trade, fill = await asyncio.wait_for(fill_future, timeout=30)
-            entry_price = fill.execution.price
-            logging.info(f"Entry order filled at {entry_price}")
-
-            # Setup stop loss
-            stop_price = entry_price - R if direction == "long" else entry_price + R
-            stop_action = "SELL" if direction == "long" else "BUY"
-            stop_loss_order = StopOrder(stop_action, share_size, stop_price)
-            stop_trade = self.ib.placeOrder(stock, stop_loss_order)
-
-            logging.info(f"Stop loss order placed at {stop_price}")
-
-            # Store active trade info for management
-            self.active_trades[stock.symbol] = {
-                "entry_price": entry_price,
-                "direction": direction,
-                "share_size": share_size,
-                "remaining_shares": share_size,
-                "stop_trade": stop_trade,
-                "first_partial_taken": False,
-                "second_partial_taken": False,
-                "partial_size": math.ceil(share_size / 3),
-            }
-
-            # Start price monitoring for this trade
-            await self.setup_price_monitoring(stock)
-
-        except asyncio.TimeoutError:
+        # Wait for the trade to fill, at most 30 seconds
+        if not await wait_for_fill(trade, timeout=30):
             logging.error("Timeout waiting for order to fill")
             self.ib.cancelOrder(trade.order)
             return None
-        finally:
-            # Remove temporary callback
-            self.ib.execDetailsEvent -= on_execution
+
+        entry_price = trade.orderStatus.avgFillPrice
+        logging.info(f"Entry order filled at {entry_price}")
+
+        # Setup stop loss
+        stop_price = entry_price - R if direction == "long" else entry_price + R
+        stop_action = "SELL" if direction == "long" else "BUY"
+        stop_loss_order = StopOrder(stop_action, share_size, stop_price)
+        stop_trade = self.ib.placeOrder(stock, stop_loss_order)
+
+        logging.info(f"Stop loss order placed at {stop_price}")
+
+        # Store active trade info for management
+        self.active_trades[stock.symbol] = {
+            "entry_price": entry_price,
+            "direction": direction,
+            "share_size": share_size,
+            "remaining_shares": share_size,
+            "stop_trade": stop_trade,
+            "first_partial_taken": False,
+            "second_partial_taken": False,
+            "partial_size": math.ceil(share_size / 3),
+        }
+
+        # Start price monitoring for this trade
+        await self.setup_price_monitoring(stock)
 
         return trade
 
@@ -263,4 +250,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    util.run(main())
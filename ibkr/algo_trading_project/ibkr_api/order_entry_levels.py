@@ -1,12 +1,21 @@
 from ib_insync import *
+import asyncio
 import time
 import logging
-import math
-import statistics
+import operator
+from dataclasses import dataclass, field
 
-# Connect to TWS API
+import numpy as np
+
+from order_helpers import (
+    calculate_dynamic_risk,
+    partition_shares,
+    wait_for_cancel,
+    wait_for_fill,
+)
+
+# Shared TWS API client; the __main__ block connects it when run as a script
 ib = IB()
-ib.connect("127.0.0.1", 7497, clientId=1)
 
 # Configure logging
 logging.basicConfig(
@@ -30,6 +39,31 @@ MIN_ADJUSTMENT_TICKS = 5  # Minimum ticks to adjust when near S/R
 MAX_ADJUSTMENT_PERCENTAGE = 0.5  # Maximum 0.5% adjustment from original target
 
 
+@dataclass
+class SRLevels:
+    """Support/resistance levels stored as parallel name and price arrays"""
+
+    names: tuple
+    prices: np.ndarray
+
+    @classmethod
+    def from_dict(cls, levels):
+        items = [(name, price) for name, price in levels.items() if price is not None]
+        return cls(
+            names=tuple(name for name, _ in items),
+            prices=np.array([price for _, price in items], dtype=np.float64),
+        )
+
+    def __bool__(self):
+        return len(self.names) > 0
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __getitem__(self, name):
+        return float(self.prices[self.names.index(name)])
+
+
 def get_account_value():
     """Get current account value from Interactive Brokers"""
     try:
@@ -193,76 +227,47 @@ def calculate_position_size(
     return position_size, actual_risk_dollars
 
 
-def get_current_price(stock):
-    """Get current market price for a stock"""
-    try:
-        ticker = ib.reqTickers(stock)[0]
-        current_price = (
-            ticker.marketPrice() if ticker.marketPrice() != 0 else ticker.last
-        )
+def get_ticker_price(ticker):
+    """Best available price from a streaming ticker, or None without data"""
+    price = ticker.marketPrice()
+    if not price > 0:
+        price = ticker.last
+    return price if price and price > 0 else None
 
-        if current_price <= 0:
-            ib.reqMktData(stock, "", False, False)
-            ib.sleep(2)
-            ticker = ib.reqTickers(stock)[0]
-            current_price = (
-                ticker.marketPrice() if ticker.marketPrice() != 0 else ticker.last
-            )
 
-        return current_price
+def get_current_price(stock, timeout=2.0):
+    """Get current market price for a stock from its streaming ticker"""
+    try:
+        # Subscribe once; later calls read the live ticker without a request
+        ticker = ib.ticker(stock)
+        if ticker is None:
+            ticker = ib.reqMktData(stock, "", False, False)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            current_price = get_ticker_price(ticker)
+            if current_price:
+                return current_price
+
+            if time.monotonic() >= deadline:
+                logging.warning(f"No market data for {stock.symbol} after {timeout}s")
+                return None
+
+            # Wake up as soon as the first tick arrives
+            ib.waitOnUpdate(timeout=0.1)
     except Exception as e:
         logging.error(f"Error getting current price: {e}")
         return None
 
 
-def calculate_dynamic_risk(stock, atr_period=14):
-    """Calculate dynamic risk based on ATR"""
-    bars = ib.reqHistoricalData(
-        stock,
-        endDateTime="",
-        durationStr="5 D",
-        barSizeSetting="15 mins",
-        whatToShow="TRADES",
-        useRTH=True,
-    )
-
-    if len(bars) > atr_period:
-        true_ranges = []
-        for i in range(1, len(bars)):
-            high = bars[i].high
-            low = bars[i].low
-            prev_close = bars[i - 1].close
-
-            tr1 = high - low
-            tr2 = abs(high - prev_close)
-            tr3 = abs(low - prev_close)
-
-            true_range = max(tr1, tr2, tr3)
-            true_ranges.append(true_range)
-
-        atr = statistics.mean(true_ranges[-atr_period:])
-        return round(atr * 0.5, 2)
-    else:
-        return 0.5
-
-
 def get_support_resistance_levels(stock):
     """Calculate key support and resistance levels"""
     levels = {}
 
     try:
-        # Get current day data
-        today_bars = ib.reqHistoricalData(
-            stock,
-            endDateTime="",
-            durationStr="1 D",
-            barSizeSetting="1 day",
-            whatToShow="TRADES",
-            useRTH=True,
-        )
-
-        # Get previous day data
-        prev_day_bars = ib.reqHistoricalData(
+        # Two daily bars cover both days: the last is today, the one before
+        # it the previous session
+        daily_bars = ib.reqHistoricalData(
             stock,
             endDateTime="",
             durationStr="2 D",
@@ -271,13 +276,13 @@ def get_support_resistance_levels(stock):
             useRTH=True,
         )
 
-        if len(today_bars) > 0:
-            today = today_bars[-1]
+        if len(daily_bars) > 0:
+            today = daily_bars[-1]
             levels["today_high"] = today.high
             levels["today_low"] = today.low
 
-        if len(prev_day_bars) >= 2:
-            prev_day = prev_day_bars[-2]
+        if len(daily_bars) >= 2:
+            prev_day = daily_bars[-2]
             levels["prev_day_high"] = prev_day.high
             levels["prev_day_low"] = prev_day.low
             levels["prev_day_close"] = prev_day.close
@@ -293,11 +298,11 @@ def get_support_resistance_levels(stock):
             levels["camarilla_s3"] = prev_close - ((prev_high - prev_low) * 1.1) / 4
 
         logging.info(f"S/R levels calculated: {levels}")
-        return levels
+        return SRLevels.from_dict(levels)
 
     except Exception as e:
         logging.error(f"Error calculating S/R levels: {e}")
-        return {}
+        return SRLevels.from_dict({})
 
 
 def is_near_support_resistance(price, sr_levels, buffer_pct=SR_BUFFER_PERCENTAGE):
@@ -305,25 +310,13 @@ def is_near_support_resistance(price, sr_levels, buffer_pct=SR_BUFFER_PERCENTAGE
     if not sr_levels:
         return False, None, None
 
-    closest_distance = float("inf")
-    closest_level = None
-    closest_name = None
+    distances = np.abs(sr_levels.prices - price)
+    closest_idx = int(np.argmin(distances))
 
-    for level_name, level_price in sr_levels.items():
-        if level_price is None:
-            continue
-
-        distance = abs(price - level_price)
-        percentage_distance = (distance / price) * 100
-
-        if percentage_distance <= buffer_pct:
-            if distance < closest_distance:
-                closest_distance = distance
-                closest_level = level_price
-                closest_name = level_name
+    if (distances[closest_idx] / price) * 100 > buffer_pct:
+        return False, None, None
 
-    is_near = closest_level is not None
-    return is_near, closest_level, closest_name
+    return True, float(sr_levels.prices[closest_idx]), sr_levels.names[closest_idx]
 
 
 def adjust_target_for_sr_levels(original_target, sr_levels, direction, current_price):
@@ -387,9 +380,12 @@ def adjust_stop_loss_for_sr_levels(original_stop, sr_levels, direction, entry_pr
     return adjusted_stop, reason
 
 
-def calculate_adjusted_targets(entry_price, risk_amount, direction, stock):
+def calculate_adjusted_targets(
+    entry_price, risk_amount, direction, stock, sr_levels=None
+):
     """Calculate targets with S/R level adjustments"""
-    sr_levels = get_support_resistance_levels(stock)
+    if sr_levels is None:
+        sr_levels = get_support_resistance_levels(stock)
 
     # Calculate original targets
     original_target1 = (
@@ -472,21 +468,18 @@ def get_price_distance(current_price, target_price, direction="long"):
     return f"{pct_distance:.2f}%", f"{ticks_distance:.0f} ticks"
 
 
-def display_trade_status(
-    current_price,
-    entry_price,
-    stop_price,
-    partial1_target,
-    partial2_target,
-    direction,
-    remaining_shares,
-    trade_stage,
-    partial3_target=None,
-    sr_levels=None,
-    account_value=None,
-    total_risk_dollars=None,
-):
+def display_trade_status(state, current_price, trade_stage):
     """Display comprehensive trade status"""
+    entry_price = state.entry_price
+    stop_price = state.current_stop_price
+    partial1_target = state.partial1_target
+    partial2_target = state.partial2_target
+    partial3_target = state.partial3_target
+    direction = state.direction
+    remaining_shares = state.remaining_shares
+    sr_levels = state.sr_levels
+    account_value = state.account_value
+    total_risk_dollars = state.total_risk_dollars
 
     # Calculate P&L
     if direction == "long":
@@ -506,7 +499,7 @@ def display_trade_status(
 
     print("\n" + "=" * 60)
     print(
-        f"TRADE STATUS - {stock.symbol} {direction.upper()} - {remaining_shares} shares - Stage: {trade_stage}"
+        f"TRADE STATUS - {state.stock.symbol} {direction.upper()} - {remaining_shares} shares - Stage: {trade_stage}"
     )
     print("=" * 60)
     print(f"Entry: ${entry_price:.2f}    Current: ${current_price:.2f}")
@@ -598,11 +591,17 @@ def display_trade_status(
 def enter_trade(
     stock,
     direction,
-    risk_percentage=ACCOUNT_RISK_PERCENTAGE,
+    risk_percentage=None,
     test_mode=False,
     test_risk_pct=0.01,
 ):
     """Enter a trade with automatic position sizing"""
+    # The sizing risks a fixed dollar amount, FIXED_RISK_DOLLARS unless given
+    if risk_percentage is None:
+        risk_percentage = FIXED_RISK_DOLLARS
+
+    entry_action = "BUY" if direction == "long" else "SELL"
+    exit_action = "SELL" if direction == "long" else "BUY"
 
     logging.info(f"Entering {direction} trade with {risk_percentage}% account risk...")
 
@@ -625,7 +624,7 @@ def enter_trade(
         logging.info(f"TEST MODE: Using small risk amount: {risk_amount}")
         share_size = 10  # Fixed small size for testing
     else:
-        risk_amount = calculate_dynamic_risk(stock)
+        risk_amount = calculate_dynamic_risk(ib, stock)
         logging.info(f"Dynamic risk calculated: {risk_amount}")
 
     # Calculate initial stop price
@@ -659,7 +658,11 @@ def enter_trade(
     # Calculate adjusted targets for validation
     adjusted_target1, adjusted_target2, adjusted_target3, _ = (
         calculate_adjusted_targets(
-            current_price, abs(current_price - adjusted_stop_price), direction, stock
+            current_price,
+            abs(current_price - adjusted_stop_price),
+            direction,
+            stock,
+            sr_levels,
         )
     )
 
@@ -675,10 +678,16 @@ def enter_trade(
     logging.info(f"Trade setup validated: {validation_message}")
 
     # Place initial market order
-    initial_action = "BUY" if direction == "long" else "SELL"
-    initial_order = MarketOrder(initial_action, share_size)
+    initial_order = MarketOrder(entry_action, share_size)
     trade = ib.placeOrder(stock, initial_order)
-    ib.sleep(2)
+
+    # Return as soon as TWS reports the fill instead of always sleeping 2s
+    deadline = time.monotonic() + 10
+    while (
+        trade.orderStatus.status not in ("Filled", "Cancelled")
+        and time.monotonic() < deadline
+    ):
+        ib.waitOnUpdate(timeout=0.5)
 
     if trade.orderStatus.status != "Filled":
         logging.warning("Order not filled within timeout period")
@@ -688,18 +697,16 @@ def enter_trade(
     logging.info(f"Initial order filled at ${entry_price:.2f} for {share_size} shares")
 
     # Recalculate stop loss based on actual entry price
-    recalculated_stop = (
-        entry_price - risk_amount if direction == "long" else entry_price + risk_amount
-    )
+    sign = 1.0 if direction == "long" else -1.0
+    recalculated_stop = entry_price - sign * risk_amount
     final_stop_price, final_stop_reason = adjust_stop_loss_for_sr_levels(
         recalculated_stop, sr_levels, direction, entry_price
     )
     logging.info(f"Final stop loss: {final_stop_reason}")
 
     # Place stop loss order
-    stop_action = "SELL" if direction == "long" else "BUY"
-    stop_loss_order = StopOrder(stop_action, share_size, final_stop_price)
-    ib.placeOrder(stock, stop_loss_order)
+    stop_loss_order = StopOrder(exit_action, share_size, final_stop_price)
+    stop_trade = ib.placeOrder(stock, stop_loss_order)
     logging.info(f"Stop loss order placed at ${final_stop_price:.2f}")
 
     # Calculate final risk metrics
@@ -719,17 +726,150 @@ def enter_trade(
     return (
         trade,
         entry_price,
-        stop_loss_order,
+        stop_trade,
         final_risk_per_share,
         sr_levels,
         share_size,
     )
 
 
-def manage_trade(
+@dataclass
+class TradeState:
+    """Mutable state shared by the manage_trade stage handlers"""
+
+    stock: Contract
+    direction: str
+    entry_price: float
+    risk_amount: float
+    partial1_target: float
+    partial2_target: float
+    partial3_target: float
+    partial_sizes: list  # Shares for each partial still to take, in order
+    remaining_shares: int
+    current_stop_price: float
+    exit_action: str
+    target_hit: object
+    sr_levels: SRLevels = None
+    account_value: float = None
+    total_risk_dollars: float = None
+    stop_trade: Trade = None
+    stop_filled: asyncio.Event = field(default_factory=asyncio.Event)
+    partial_size: int = 0  # Shares in the partial most recently taken
+
+    def track_stop(self, stop_trade):
+        """Make stop_trade the active stop and get notified when it fills"""
+        self.stop_trade = stop_trade
+        stop_trade.filledEvent += self.on_stop_filled
+
+    def on_stop_filled(self, filled_trade):
+        self.stop_filled.set()
+
+    def take_partial(self, stop_price):
+        """Cancel the active stop, then send the next partial and a new stop at
+        stop_price for the shares left back-to-back. Returns the partial trade,
+        None when the partial is empty, and the old stop"""
+        self.partial_size = self.partial_sizes.pop(0)
+        self.remaining_shares -= self.partial_size
+        old_stop = self.stop_trade
+        new_stop = StopOrder(self.exit_action, self.remaining_shares, stop_price)
+
+        ib.cancelOrder(old_stop.order)
+        partial_trade = None
+        if self.partial_size:  # TWS rejects zero-quantity orders
+            partial_order = MarketOrder(self.exit_action, self.partial_size)
+            partial_trade = ib.placeOrder(self.stock, partial_order)
+        stop_trade = ib.placeOrder(self.stock, new_stop)
+
+        self.track_stop(stop_trade)
+        self.current_stop_price = stop_price
+        return partial_trade, old_stop
+
+    async def confirm_partial(self, partial_trade, old_stop):
+        """Wait for the partial fill and the old stop's cancel at the same time"""
+        waits = [wait_for_cancel(old_stop)]
+        if partial_trade is not None:
+            waits.append(wait_for_fill(partial_trade))
+        await asyncio.gather(*waits)
+
+
+async def on_tick_initial(state, current_price):
+    """Take the first partial and move the stop to break-even"""
+    if not state.target_hit(current_price, state.partial1_target):
+        return "Initial"
+
+    logging.info("First partial target hit.")
+
+    # Move stop to break-even
+    new_stop_price = state.entry_price
+
+    # Cancel the initial stop, then submit partial and new stop back-to-back
+    partial_trade, old_stop = state.take_partial(new_stop_price)
+    logging.info(
+        "Partial order of %s shares placed and initial stop canceled.",
+        state.partial_size,
+    )
+    logging.info("Break-even stop placed at $%.2f", new_stop_price)
+
+    await state.confirm_partial(partial_trade, old_stop)
+    return "Partial1"
+
+
+async def on_tick_partial1(state, current_price):
+    """Take the second partial and lock in 1R of profit on the rest"""
+    if not state.target_hit(current_price, state.partial2_target):
+        return "Partial1"
+
+    logging.info("Second partial target hit.")
+
+    # Set profit-lock stop
+    new_stop_price = (
+        state.entry_price + state.risk_amount
+        if state.direction == "long"
+        else state.entry_price - state.risk_amount
+    )
+
+    # Cancel the break-even stop, then submit partial and new stop back-to-back
+    partial_trade, old_stop = state.take_partial(new_stop_price)
+    logging.info(
+        "Second partial order of %s shares placed and break-even stop canceled.",
+        state.partial_size,
+    )
+    logging.info("Profit-lock stop placed at $%.2f", new_stop_price)
+
+    await state.confirm_partial(partial_trade, old_stop)
+    return "Partial2"
+
+
+async def on_tick_partial2(state, current_price):
+    """Close the remaining shares at the final target"""
+    if not state.target_hit(current_price, state.partial3_target):
+        return "Partial2"
+
+    logging.info("Third/Final target hit.")
+    final_order = MarketOrder(state.exit_action, state.remaining_shares)
+    final_trade = ib.placeOrder(state.stock, final_order)
+    ib.cancelOrder(state.stop_trade.order)
+    logging.info(
+        "Final order of %s shares placed. Trade completed.", state.remaining_shares
+    )
+
+    state.remaining_shares = 0
+    await asyncio.gather(wait_for_fill(final_trade), wait_for_cancel(state.stop_trade))
+    return "Complete"
+
+
+# Each handler checks only the target for its own stage and returns the next stage
+STAGE_HANDLERS = {
+    "Initial": on_tick_initial,
+    "Partial1": on_tick_partial1,
+    "Partial2": on_tick_partial2,
+}
+
+
+async def manage_trade(
     entry_price,
     trade,
-    stop_loss_order,
+    stop_trade,
     direction,
     share_size,
     risk_amount,
@@ -740,272 +880,221 @@ def manage_trade(
 ):
     """Manage the trade with partial profit taking"""
 
-    logging.info(f"Managing {direction} trade...")
+    logging.info("Managing %s trade...", direction)
 
     # Calculate adjusted targets using S/R levels
     partial1_target, partial2_target, partial3_target, _ = calculate_adjusted_targets(
-        entry_price, risk_amount, direction, stock
+        entry_price, risk_amount, direction, stock, sr_levels
     )
 
     logging.info(
-        f"Adjusted targets - T1: ${partial1_target:.2f}, T2: ${partial2_target:.2f}, T3: ${partial3_target:.2f}"
+        "Adjusted targets - T1: $%.2f, T2: $%.2f, T3: $%.2f",
+        partial1_target,
+        partial2_target,
+        partial3_target,
     )
 
+    # Direction never changes during the trade, so pick the comparisons once
+    if direction == "long":
+        target_hit, stop_hit = operator.ge, operator.le
+        exit_action = "SELL"
+    else:
+        target_hit, stop_hit = operator.le, operator.ge
+        exit_action = "BUY"
+
     # Initial position setup
-    remaining_shares = share_size
-    first_partial = False
-    second_partial = False
-    partial_size = math.ceil(share_size / 3)
-
-    # Current stop price
-    current_stop_price = (
-        entry_price - risk_amount if direction == "long" else entry_price + risk_amount
+    state = TradeState(
+        stock=stock,
+        direction=direction,
+        entry_price=entry_price,
+        risk_amount=risk_amount,
+        partial1_target=partial1_target,
+        partial2_target=partial2_target,
+        partial3_target=partial3_target,
+        # Equal thirds in whole shares, the remainder on the last, so small
+        # sizes leave the early partials empty and the stop always has shares
+        partial_sizes=partition_shares(share_size, (1, 1, 1)),
+        remaining_shares=share_size,
+        current_stop_price=(
+            entry_price - risk_amount
+            if direction == "long"
+            else entry_price + risk_amount
+        ),
+        exit_action=exit_action,
+        target_hit=target_hit,
+        sr_levels=sr_levels,
+        account_value=account_value,
+        total_risk_dollars=total_risk_dollars,
     )
 
+    # Get notified by TWS as soon as the active stop order fills
+    state.track_stop(stop_trade)
+
     # Trade stage tracking
     trade_stage = "Initial"
-    display_counter = 0
+    last_display_time = time.time()
 
     # For testing - simulate price movement
     start_time = time.time()
     manual_modification_check_time = time.time()
 
-    # Main trade management loop
-    while remaining_shares > 0:
-        # Check portfolio for current position
-        portfolio = ib.portfolio()
-        position_exists = False
-        actual_position_size = 0
-
-        for item in portfolio:
-            if item.contract.symbol == stock.symbol:
-                position_exists = True
-                if direction == "long":
-                    actual_position_size = max(0, int(item.position))
-                else:
-                    actual_position_size = abs(min(0, int(item.position)))
-
-                if actual_position_size == 0:
-                    logging.info("Position is 0. Exiting trade management.")
-                    return
-
-                # Check for manual modifications
-                if time.time() - manual_modification_check_time > 10:
-                    if actual_position_size != remaining_shares:
-                        logging.info(
-                            f"Position size changed from {remaining_shares} to {actual_position_size}"
-                        )
-                        remaining_shares = actual_position_size
-                    manual_modification_check_time = time.time()
-
-        if not position_exists:
-            logging.info("Position not found in portfolio. Exiting trade management.")
-            return
-
-        # Get latest price
-        current_price = get_current_price(stock)
-        if not current_price:
-            logging.warning("Could not get current price")
-            ib.sleep(1)
-            continue
-
-        # TEST MODE: Simulate price movement
-        elapsed_seconds = time.time() - start_time
-        if TEST_MODE:
-            if elapsed_seconds > 5 and not first_partial:
-                logging.info("TEST MODE: Simulating price movement for first partial")
-                current_price = (
-                    partial1_target + 0.01
-                    if direction == "long"
-                    else partial1_target - 0.01
-                )
-            elif elapsed_seconds > 10 and first_partial and not second_partial:
-                logging.info("TEST MODE: Simulating price movement for second partial")
-                current_price = (
-                    partial2_target + 0.01
-                    if direction == "long"
-                    else partial2_target - 0.01
-                )
-            elif elapsed_seconds > 15 and second_partial:
-                logging.info("TEST MODE: Simulating price movement for third target")
-                current_price = (
-                    partial3_target + 0.01
-                    if direction == "long"
-                    else partial3_target - 0.01
-                )
-            elif elapsed_seconds > 20 and remaining_shares > 0:
-                logging.info("TEST MODE: Simulating stop loss trigger")
-                current_price = (
-                    entry_price - (2 * risk_amount)
-                    if direction == "long"
-                    else entry_price + (2 * risk_amount)
-                )
+    # Subscribe once and only re-evaluate the trade when a new tick arrives
+    ticker = ib.ticker(stock) or ib.reqMktData(stock, "", False, False)
+    tick_event = asyncio.Event()
 
-        # Display status periodically
-        display_counter += 1
-        if display_counter >= 5:
-            display_trade_status(
-                current_price,
-                entry_price,
-                current_stop_price,
-                partial1_target,
-                partial2_target,
-                direction,
-                remaining_shares,
-                trade_stage,
-                partial3_target,
-                sr_levels,
-                account_value,
-                total_risk_dollars,
-            )
-            display_counter = 0
-
-        # First partial take profit
-        if not first_partial and (
-            (
-                current_price >= partial1_target
-                if direction == "long"
-                else current_price <= partial1_target
-            )
-        ):
-            logging.info("First partial target hit.")
-            partial_action = "SELL" if direction == "long" else "BUY"
-            partial_order1 = MarketOrder(partial_action, partial_size)
-            ib.placeOrder(stock, partial_order1)
-            ib.cancelOrder(stop_loss_order)
-            logging.info(
-                f"Partial order of {partial_size} shares placed and initial stop canceled."
-            )
+    def on_tick(tickers):
+        if ticker in tickers:
+            tick_event.set()
 
-            # Move stop to break-even
-            new_stop_price = entry_price
-            stop_action = "SELL" if direction == "long" else "BUY"
-            break_even_stop = StopOrder(
-                stop_action, remaining_shares - partial_size, new_stop_price
-            )
-            ib.placeOrder(stock, break_even_stop)
-            logging.info(f"Break-even stop placed at ${new_stop_price:.2f}")
-
-            remaining_shares -= partial_size
-            first_partial = True
-            stop_loss_order = break_even_stop
-            current_stop_price = new_stop_price
-            trade_stage = "Partial1"
-
-            ib.sleep(2)
-
-        # Second partial take profit
-        elif (
-            first_partial
-            and not second_partial
-            and (
-                (
-                    current_price >= partial2_target
-                    if direction == "long"
-                    else current_price <= partial2_target
-                )
-            )
-        ):
-            logging.info("Second partial target hit.")
-            partial_action = "SELL" if direction == "long" else "BUY"
-            partial_order2 = MarketOrder(partial_action, partial_size)
-            ib.placeOrder(stock, partial_order2)
-            ib.cancelOrder(stop_loss_order)
-            logging.info(
-                f"Second partial order of {partial_size} shares placed and break-even stop canceled."
-            )
+    ib.pendingTickersEvent += on_tick
 
-            # Set profit-lock stop
-            new_stop_price = (
-                entry_price + risk_amount
-                if direction == "long"
-                else entry_price - risk_amount
-            )
-            stop_action = "SELL" if direction == "long" else "BUY"
-            profit_lock_stop = StopOrder(
-                stop_action, remaining_shares - partial_size, new_stop_price
-            )
-            ib.placeOrder(stock, profit_lock_stop)
-            logging.info(f"Profit-lock stop placed at ${new_stop_price:.2f}")
-
-            remaining_shares -= partial_size
-            second_partial = True
-            stop_loss_order = profit_lock_stop
-            current_stop_price = new_stop_price
-            trade_stage = "Partial2"
-
-            ib.sleep(2)
-
-        # Third partial take profit
-        elif second_partial and (
-            (
-                current_price >= partial3_target
-                if direction == "long"
-                else current_price <= partial3_target
-            )
-        ):
-            logging.info("Third/Final target hit.")
-            partial_action = "SELL" if direction == "long" else "BUY"
-            final_order = MarketOrder(partial_action, remaining_shares)
-            ib.placeOrder(stock, final_order)
-            ib.cancelOrder(stop_loss_order)
-            logging.info(
-                f"Final order of {remaining_shares} shares placed. Trade completed."
-            )
+    # Keep a symbol -> position map that TWS updates, instead of scanning the portfolio
+    symbol = stock.symbol
+    positions_by_symbol = {p.contract.symbol: p for p in ib.positions()}
 
-            remaining_shares = 0
-            trade_stage = "Complete"
-
-        # Check for stop loss
-        if (current_price <= current_stop_price and direction == "long") or (
-            current_price >= current_stop_price and direction == "short"
-        ):
-            logging.info(f"Stop loss at ${current_stop_price:.2f} likely triggered.")
-
-            ib.sleep(1)  # Wait for order to process
-            portfolio = ib.portfolio()
-            position_closed = True
-
-            for item in portfolio:
-                if item.contract.symbol == stock.symbol:
-                    if (direction == "long" and item.position > 0) or (
-                        direction == "short" and item.position < 0
-                    ):
-                        position_closed = False
-                        logging.info(
-                            f"Position still open after stop hit: {item.position} shares remaining"
-                        )
-                        remaining_shares = abs(item.position)
-                        break
-
-            if position_closed:
+    def on_position(position):
+        positions_by_symbol[position.contract.symbol] = position
+
+    ib.positionEvent += on_position
+
+    # Main trade management loop
+    try:
+        while state.remaining_shares > 0:
+            try:
+                await asyncio.wait_for(tick_event.wait(), timeout=1 if TEST_MODE else 5)
+            except asyncio.TimeoutError:
+                if not TEST_MODE:
+                    continue
+            tick_event.clear()
+
+            # Check current position
+            position = positions_by_symbol.get(symbol)
+            if position is None:
                 logging.info(
-                    "Position verified as closed - stop loss executed successfully"
+                    "Position not found in portfolio. Exiting trade management."
                 )
-                remaining_shares = 0
+                return
+
+            if direction == "long":
+                actual_position_size = max(0, int(position.position))
             else:
-                # Force close if stop didn't trigger
-                logging.warning(
-                    "Stop loss should have triggered but position still open - forcing close"
-                )
-                close_action = "SELL" if direction == "long" else "BUY"
-                close_order = MarketOrder(close_action, remaining_shares)
-                ib.placeOrder(stock, close_order)
+                actual_position_size = abs(min(0, int(position.position)))
+
+            if actual_position_size == 0:
+                logging.info("Position is 0. Exiting trade management.")
+                return
+
+            # Check for manual modifications
+            if time.time() - manual_modification_check_time > 10:
+                if actual_position_size != state.remaining_shares:
+                    logging.info(
+                        "Position size changed from %s to %s",
+                        state.remaining_shares,
+                        actual_position_size,
+                    )
+                    state.remaining_shares = actual_position_size
+                manual_modification_check_time = time.time()
+
+            # Get latest price
+            current_price = get_ticker_price(ticker)
+            if not current_price:
+                logging.warning("Could not get current price")
+                continue
+
+            # TEST MODE: Simulate price movement
+            elapsed_seconds = time.time() - start_time
+            if TEST_MODE:
+                if elapsed_seconds > 5 and trade_stage == "Initial":
+                    logging.info(
+                        "TEST MODE: Simulating price movement for first partial"
+                    )
+                    current_price = (
+                        partial1_target + 0.01
+                        if direction == "long"
+                        else partial1_target - 0.01
+                    )
+                elif elapsed_seconds > 10 and trade_stage == "Partial1":
+                    logging.info(
+                        "TEST MODE: Simulating price movement for second partial"
+                    )
+                    current_price = (
+                        partial2_target + 0.01
+                        if direction == "long"
+                        else partial2_target - 0.01
+                    )
+                elif elapsed_seconds > 15 and trade_stage == "Partial2":
+                    logging.info(
+                        "TEST MODE: Simulating price movement for third target"
+                    )
+                    current_price = (
+                        partial3_target + 0.01
+                        if direction == "long"
+                        else partial3_target - 0.01
+                    )
+                elif elapsed_seconds > 20 and state.remaining_shares > 0:
+                    logging.info("TEST MODE: Simulating stop loss trigger")
+                    current_price = (
+                        entry_price - (2 * risk_amount)
+                        if direction == "long"
+                        else entry_price + (2 * risk_amount)
+                    )
+
+            # Display status periodically (ticks can arrive several times a second)
+            if time.time() - last_display_time >= 5:
+                display_trade_status(state, current_price, trade_stage)
+                last_display_time = time.time()
+
+            # Dispatch to the handler for the current stage
+            trade_stage = await STAGE_HANDLERS[trade_stage](state, current_price)
+            if trade_stage == "Complete":
+                logging.info("All shares have been sold/bought back.")
+                break
+
+            # Check for stop loss
+            if stop_hit(current_price, state.current_stop_price):
                 logging.info(
-                    f"Emergency close order placed for remaining {remaining_shares} shares"
+                    "Stop loss at $%.2f likely triggered.", state.current_stop_price
                 )
-                ib.sleep(2)
-                remaining_shares = 0
 
-            break
-
-        # Break if all shares are gone
-        if remaining_shares <= 0:
-            logging.info("All shares have been sold/bought back.")
-            break
-
-        # Sleep to reduce API calls
-        ib.sleep(1)
+                # Wait for the stop fill to be pushed instead of polling the portfolio
+                try:
+                    await asyncio.wait_for(state.stop_filled.wait(), timeout=2)
+                except asyncio.TimeoutError:
+                    pass
+
+                position_closed = state.stop_filled.is_set()
+                if not position_closed:
+                    state.remaining_shares = int(state.stop_trade.remaining())
+                    logging.info(
+                        "Position still open after stop hit: %s shares remaining",
+                        state.remaining_shares,
+                    )
+
+                if position_closed:
+                    logging.info(
+                        "Position verified as closed - stop loss executed successfully"
+                    )
+                    state.remaining_shares = 0
+                else:
+                    # Force close if stop didn't trigger
+                    logging.warning(
+                        "Stop loss should have triggered but position still open - forcing close"
+                    )
+                    ib.cancelOrder(state.stop_trade.order)
+                    close_order = MarketOrder(exit_action, state.remaining_shares)
+                    close_trade = ib.placeOrder(stock, close_order)
+                    logging.info(
+                        "Emergency close order placed for remaining %s shares",
+                        state.remaining_shares,
+                    )
+                    await wait_for_fill(close_trade)
+                    state.remaining_shares = 0
+
+                break
+    finally:
+        ib.pendingTickersEvent -= on_tick
+        ib.positionEvent -= on_position
+        ib.cancelMktData(stock)
 
     logging.info("Trade management complete.")
 
@@ -1038,9 +1127,7 @@ if __name__ == "__main__":
         if result[0] is None:  # Check if trade entry failed
             logging.warning("Trade entry failed, exiting.")
         else:
-            trade, entry_price, stop_loss_order, risk_amount, sr_levels, share_size = (
-                result
-            )
+            trade, entry_price, stop_trade, risk_amount, sr_levels, share_size = result
 
             # Get account value for display
             account_value = get_account_value() or 0
@@ -1061,7 +1148,7 @@ if __name__ == "__main__":
 
             # Calculate and display adjusted targets
             target1, target2, target3, _ = calculate_adjusted_targets(
-                entry_price, risk_amount, direction, stock
+                entry_price, risk_amount, direction, stock, sr_levels
             )
 
             logging.info(f"Adjusted Target 1: ${target1:.2f} (1.5R)")
@@ -1090,17 +1177,19 @@ if __name__ == "__main__":
             logging.info("=" * 60)
 
             # Start trade management
-            manage_trade(
-                entry_price,
-                trade,
-                stop_loss_order,
-                direction,
-                share_size,
-                risk_amount,
-                stock,
-                sr_levels,
-                account_value,
-                total_risk_dollars,
+            ib.run(
+                manage_trade(
+                    entry_price,
+                    trade,
+                    stop_trade,
+                    direction,
+                    share_size,
+                    risk_amount,
+                    stock,
+                    sr_levels,
+                    account_value,
+                    total_risk_dollars,
+                )
             )
 
     except Exception as e:
@@ -1,14 +1,12 @@
 from ib_insync import *
+import asyncio
 import time
 import logging
 import math
+import operator
 
-# Connect to TWS API
+# Shared TWS API client; main() (or the importing script) connects it
 ib = IB()
-# Disconnect from API
-# if ib.isConnected():
-#     ib.disconnect()
-ib.connect("127.0.0.1", 7497, clientId=1)
 
 # Configure logging
 logging.basicConfig(
@@ -36,133 +34,192 @@ def create_trailing_stop_order(action, quantity, trail_amount):
     return trailing_stop_order
 
 
+def take_partial(stock, partial_order, old_stop, new_stop):
+    """Cancel the active stop, then send the partial and its new stop back-to-back"""
+    ib.cancelOrder(old_stop)
+    for order in (partial_order, new_stop):
+        ib.placeOrder(stock, order)
+    return new_stop
+
+
 def enter_trade(stock, direction, share_size):
     logging.info("Entering trade...")
+    entry_action = "BUY" if direction == "long" else "SELL"
+    exit_action = "SELL" if direction == "long" else "BUY"
     # Place initial market order for share_size shares
-    initial_action = "BUY" if direction == "long" else "SELL"
-    initial_order = MarketOrder(initial_action, share_size)
+    initial_order = MarketOrder(entry_action, share_size)
     trade = ib.placeOrder(stock, initial_order)
-    ib.sleep(2)  # Wait for the order to fill
+
+    # Wait until TWS reports the fill, giving up after 10 seconds
+    deadline = time.monotonic() + 10
+    while (
+        trade.orderStatus.status not in ("Filled", "Cancelled")
+        and time.monotonic() < deadline
+    ):
+        ib.waitOnUpdate(timeout=0.5)
+
+    if trade.orderStatus.status != "Filled":
+        logging.warning("Order not filled within timeout period")
+        return None, None, None
+
     entry_price = trade.orderStatus.avgFillPrice  # Capture fill price for reference
-    logging.info(f"Initial order filled at {entry_price}")
-
-    # Set initial stop loss
-    stop_price = (
-        entry_price - R if direction == "long" else entry_price + R
-    )  # Stop loss logic for long/short
-    stop_action = "SELL" if direction == "long" else "BUY"
-    stop_loss_order = StopOrder(stop_action, share_size, stop_price)
+    logging.info("Initial order filled at %s", entry_price)
+
+    # Set initial stop loss one R against the position
+    sign = 1.0 if direction == "long" else -1.0
+    stop_price = entry_price - sign * R
+    stop_loss_order = StopOrder(exit_action, share_size, stop_price)
     ib.placeOrder(stock, stop_loss_order)
-    logging.info(f"Stop loss order placed at {stop_price}")
+    logging.info("Stop loss order placed at %s", stop_price)
 
     return trade, entry_price, stop_loss_order
 
 
-def manage_trade(entry_price, trade, stop_loss_order, direction, share_size):
+async def manage_trade(
+    entry_price, trade, stop_loss_order, direction, share_size, stock
+):
     logging.info("Managing trade...")
-    # Set profit targets
-    partial1_target = entry_price + R if direction == "long" else entry_price - R
-    partial2_target = (
-        entry_price + 2 * R if direction == "long" else entry_price - 2 * R
-    )
+    # Direction never changes during the trade, so pick the comparisons once
+    if direction == "long":
+        sign = 1.0
+        target_hit, stop_hit = operator.ge, operator.le
+        exit_action = "SELL"
+    else:
+        sign = -1.0
+        target_hit, stop_hit = operator.le, operator.ge
+        exit_action = "BUY"
+
+    # Set profit targets and the stop, signed by direction
+    partial1_target = entry_price + sign * R
+    partial2_target = entry_price + sign * 2 * R
+    stop_price = entry_price - sign * R
     remaining_shares = share_size
     first_partial = False
 
+    # Share counts left after each partial, fixed for the whole trade
     partial_size = math.ceil(share_size / 3)
-
-    while remaining_shares > 0:
-        # Check portfolio for current position
-        portfolio = ib.portfolio()
-        for item in portfolio:
-            if item.contract.symbol == stock.symbol:
-                if int(item.position) == 0:
-                    logging.info("Position is 0. Exiting trade management.")
-                    return  # Exit the function if the position is 0
-
-        # Get latest price
-        market_data = ib.reqMktData(stock)
-        ib.sleep(0.1)  # Short delay for price polling
-        current_price = market_data.last
-        logging.info(f"Current price: {current_price}")
-
-        # First partial take profit
-        if not first_partial and (
-            (
-                current_price >= partial1_target
-                if direction == "long"
-                else current_price <= partial1_target
-            )
-        ):
-            logging.info("First partial take profit target hit.")
-            # Take partial of partial_size shares
-            partial_action = "SELL" if direction == "long" else "BUY"
-            partial_order1 = MarketOrder(partial_action, partial_size)
-            ib.placeOrder(stock, partial_order1)
-            ib.cancelOrder(stop_loss_order)  # Remove initial stop
-            logging.info(
-                f"Partial order of {partial_size} shares placed and initial stop loss canceled."
-            )
-
-            # Adjust stop to break-even
-            new_stop_price = entry_price
-            stop_action = "SELL" if direction == "long" else "BUY"
-            break_even_stop = StopOrder(
-                stop_action, share_size - partial_size, new_stop_price
-            )
-            ib.placeOrder(stock, break_even_stop)
-            logging.info(f"Break-even stop loss order placed at {new_stop_price}")
-            remaining_shares -= partial_size
-            first_partial = True  # Ensure first partial is only taken once
-
-        # Second partial take profit
-        if remaining_shares == share_size - partial_size and (
-            (
-                current_price >= partial2_target
-                if direction == "long"
-                else current_price <= partial2_target
-            )
-        ):
-            logging.info("Second partial take profit target hit.")
-            # Take another partial of partial_size shares
-            partial_order2 = MarketOrder(partial_action, partial_size)
-            ib.placeOrder(stock, partial_order2)
-            ib.cancelOrder(break_even_stop)  # Remove break-even stop
-            logging.info(
-                f"Partial order of {partial_size} shares placed and break-even stop loss canceled."
-            )
-
-            # Set trailing stop for remaining shares
-            trail_amount = R
-            trailing_action = "SELL" if direction == "long" else "BUY"
-            trailing_stop_order = create_trailing_stop_order(
-                trailing_action, remaining_shares - partial_size, trail_amount
-            )
-            ib.placeOrder(stock, trailing_stop_order)
-            logging.info(
-                f"Trailing stop order placed for remaining {remaining_shares - partial_size} shares."
-            )
-            remaining_shares -= partial_size
-
-        # Stop loss triggered
-        if (current_price <= entry_price - R and direction == "long") or (
-            current_price >= entry_price + R and direction == "short"
-        ):
-            logging.info("Stop loss triggered.")
-            break
-        if remaining_shares == 0:
-            logging.info("All shares have been sold.")
-            break
-        ib.sleep(1)
-
-
-# Main execution
-direction = "long"  # Change to 'long' or 'short' based on the desired trade
-share_size = 100  # Define the initial share size
-# Define contract for the stock (e.g., NVDA)
-stock = Stock("NVDA", "SMART", "USD")
-trade, entry_price, stop = enter_trade(stock, direction, share_size)
-manage_trade(entry_price, trade, stop, direction, share_size)
-
-
-# Disconnect from API
-ib.disconnect()
+    shares_after_p1 = share_size - partial_size
+    shares_after_p2 = shares_after_p1 - partial_size
+
+    # Subscribe once and only re-check targets when a new tick arrives
+    ticker = ib.reqMktData(stock, "", False, False)
+    tick_event = asyncio.Event()
+
+    def on_tick(tickers):
+        if ticker in tickers:
+            tick_event.set()
+
+    ib.pendingTickersEvent += on_tick
+
+    # Keep a symbol -> position map that TWS updates, instead of scanning the portfolio
+    symbol = stock.symbol
+    positions_by_symbol = {p.contract.symbol: p for p in ib.positions()}
+
+    def on_position(position):
+        positions_by_symbol[position.contract.symbol] = position
+
+    ib.positionEvent += on_position
+
+    try:
+        while remaining_shares > 0:
+            try:
+                await asyncio.wait_for(tick_event.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                continue
+            tick_event.clear()
+
+            # Check current position
+            position = positions_by_symbol.get(symbol)
+            if position and int(position.position) == 0:
+                logging.info("Position is 0. Exiting trade management.")
+                return  # Exit the function if the position is 0
+
+            # Get latest price
+            current_price = ticker.last
+            logging.info("Current price: %s", current_price)
+
+            # First partial take profit
+            if not first_partial and target_hit(current_price, partial1_target):
+                logging.info("First partial take profit target hit.")
+                # Take partial of partial_size shares
+                partial_order1 = MarketOrder(exit_action, partial_size)
+
+                # Adjust stop to break-even
+                new_stop_price = entry_price
+                break_even_stop = StopOrder(
+                    exit_action, shares_after_p1, new_stop_price
+                )
+
+                # Cancel the initial stop, then submit partial and new stop
+                stop_loss_order = take_partial(
+                    stock, partial_order1, stop_loss_order, break_even_stop
+                )
+                logging.info(
+                    "Partial order of %s shares placed and initial stop loss canceled.",
+                    partial_size,
+                )
+                logging.info("Break-even stop loss order placed at %s", new_stop_price)
+                remaining_shares = shares_after_p1
+                first_partial = True  # Ensure first partial is only taken once
+
+            # Second partial take profit
+            if remaining_shares == shares_after_p1 and target_hit(
+                current_price, partial2_target
+            ):
+                logging.info("Second partial take profit target hit.")
+                # Take another partial of partial_size shares
+                partial_order2 = MarketOrder(exit_action, partial_size)
+
+                # Set trailing stop for remaining shares
+                trail_amount = R
+                trailing_stop_order = create_trailing_stop_order(
+                    exit_action, shares_after_p2, trail_amount
+                )
+
+                # Cancel the break-even stop, then submit partial and trailing stop
+                stop_loss_order = take_partial(
+                    stock, partial_order2, stop_loss_order, trailing_stop_order
+                )
+                logging.info(
+                    "Partial order of %s shares placed and break-even stop loss canceled.",
+                    partial_size,
+                )
+                logging.info(
+                    "Trailing stop order placed for remaining %s shares.",
+                    shares_after_p2,
+                )
+                remaining_shares = shares_after_p2
+
+            # Stop loss triggered
+            if stop_hit(current_price, stop_price):
+                logging.info("Stop loss triggered.")
+                break
+            if remaining_shares == 0:
+                logging.info("All shares have been sold.")
+                break
+    finally:
+        ib.pendingTickersEvent -= on_tick
+        ib.positionEvent -= on_position
+        ib.cancelMktData(stock)
+
+
+def main():
+    # Connect to TWS API
+    ib.connect("127.0.0.1", 7497, clientId=1)
+
+    direction = "long"  # Change to 'long' or 'short' based on the desired trade
+    share_size = 100  # Define the initial share size
+    # Define contract for the stock (e.g., NVDA)
+    stock = Stock("NVDA", "SMART", "USD")
+    trade, entry_price, stop = enter_trade(stock, direction, share_size)
+    if trade is None:
+        logging.warning("Trade entry failed, exiting.")
+    else:
+        ib.run(manage_trade(entry_price, trade, stop, direction, share_size, stock))
+
+    # Disconnect from API
+    ib.disconnect()
+
+
+if __name__ == "__main__":
+    main()
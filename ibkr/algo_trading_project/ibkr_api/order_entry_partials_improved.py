@@ -1,12 +1,17 @@
 from ib_insync import *
+import asyncio
+import dataclasses
 import time
+from dataclasses import dataclass
 import logging
 import math
-import statistics
+import operator
 
-# Connect to TWS API
+from order_helpers import calculate_dynamic_risk, wait_for_cancel, wait_for_fill
+
+# Shared TWS API client; the __main__ block (or the importing script) connects
+# it once and it is reused for every trade
 ib = IB()
-ib.connect("127.0.0.1", 7497, clientId=1)
 
 # Configure logging
 logging.basicConfig(
@@ -14,46 +19,12 @@ logging.basicConfig(
 )
 
 # Global configuration for testing
-TEST_MODE = True  # Set to True for faster testing
+TEST_MODE = False  # Set to True for faster testing
 TEST_RISK_PCT = 0.001  # 0.1% risk for very tight targets in test mode
 
-
-# Calculate dynamic risk based on ATR (Average True Range)
-def calculate_dynamic_risk(stock, atr_period=14):
-    """
-    Calculate dynamic risk based on ATR
-    """
-    # Get historical data
-    bars = ib.reqHistoricalData(
-        stock,
-        endDateTime="",
-        durationStr="5 D",
-        barSizeSetting="15 mins",
-        whatToShow="TRADES",
-        useRTH=True,
-    )
-
-    # Calculate ATR
-    if len(bars) > atr_period:
-        true_ranges = []
-        for i in range(1, len(bars)):
-            high = bars[i].high
-            low = bars[i].low
-            prev_close = bars[i - 1].close
-
-            tr1 = high - low
-            tr2 = abs(high - prev_close)
-            tr3 = abs(low - prev_close)
-
-            true_range = max(tr1, tr2, tr3)
-            true_ranges.append(true_range)
-
-        atr = statistics.mean(true_ranges[-atr_period:])
-        # Return ATR adjusted value (you can tune this multiplier)
-        return round(atr * 0.5, 2)
-    else:
-        # Default if not enough data
-        return 0.5
+# Prices are compared in whole ticks ($0.01), so a price that lands exactly on a
+# target always counts as reaching it, whatever its float representation
+TICKS_PER_DOLLAR = 100
 
 
 def create_trailing_stop_order(action, quantity, trail_amount):
@@ -71,7 +42,7 @@ def create_trailing_stop_order(action, quantity, trail_amount):
 
 
 def enter_trade(stock, direction, share_size, test_mode=False, test_risk_pct=0.01):
-    logging.info(f"Entering {direction} trade...")
+    logging.info("Entering %s trade...", direction)
 
     if test_mode:
         # In test mode, use a very small risk amount (e.g., 1% of price)
@@ -83,24 +54,28 @@ def enter_trade(stock, direction, share_size, test_mode=False, test_risk_pct=0.0
         risk_amount = round(
             current_price * test_risk_pct, 2
         )  # Small percentage of price
-        logging.info(f"TEST MODE: Using small risk amount: {risk_amount}")
+        logging.info("TEST MODE: Using small risk amount: %s", risk_amount)
     else:
         # Normal operation - calculate dynamic risk based on ATR
-        risk_amount = calculate_dynamic_risk(stock)
-        logging.info(f"Dynamic risk calculated: {risk_amount}")
+        risk_amount = calculate_dynamic_risk(ib, stock)
+        logging.info("Dynamic risk calculated: %s", risk_amount)
 
     # Place initial market order for share_size shares
     initial_action = "BUY" if direction == "long" else "SELL"
     initial_order = MarketOrder(initial_action, share_size)
     trade = ib.placeOrder(stock, initial_order)
-    ib.sleep(2)  # Wait for the order to fill
+
+    # Wait until TWS reports the order done, giving up after 2 seconds
+    deadline = time.monotonic() + 2
+    while not trade.isDone() and time.monotonic() < deadline:
+        ib.waitOnUpdate(timeout=deadline - time.monotonic())
 
     if trade.orderStatus.status != "Filled":
         logging.warning("Order not filled within timeout period")
         return None, None, None, None
 
     entry_price = trade.orderStatus.avgFillPrice
-    logging.info(f"Initial order filled at {entry_price}")
+    logging.info("Initial order filled at %s", entry_price)
 
     # Set initial stop loss
     stop_price = (
@@ -109,7 +84,7 @@ def enter_trade(stock, direction, share_size, test_mode=False, test_risk_pct=0.0
     stop_action = "SELL" if direction == "long" else "BUY"
     stop_loss_order = StopOrder(stop_action, share_size, stop_price)
     ib.placeOrder(stock, stop_loss_order)
-    logging.info(f"Stop loss order placed at {stop_price}")
+    logging.info("Stop loss order placed at %s", stop_price)
 
     return trade, entry_price, stop_loss_order, risk_amount
 
@@ -135,7 +110,107 @@ def get_price_distance(current_price, target_price, direction="long"):
     return f"{pct_distance:.2f}%", f"{ticks_distance:.0f} ticks"
 
 
+# Status box layouts by (stage, has third target), built once at import.
+# Each row is padded inside its borders as it is formatted, so the box needs
+# no fixing up afterwards.
+_HEADER_ROWS = (
+    "Symbol: {symbol:<7}  Direction: {direction:<5}  Shares: {shares:<4}",
+    "Stage: {stage:<7}",
+)
+_PNL_ROWS = (
+    "Entry: {entry:<7.2f}    Current: {current:<7.2f}",
+    "P&L:   {pnl_sign}{points_pnl:<+7.2f} pts ({pnl_sign}{pct_pnl:.2f}%)",
+)
+_DOLLAR_PNL_ROW = "P&L:   ${pnl_sign}{dollar_pnl:.2f} (approx. {shares} shares)"
+_TARGET1_ROW = "Target 1 @ {target1:<7.2f}  Distance: {tp1_pct} ({tp1_ticks})"
+_TARGET2_ROW = "Target 2 @ {target2:<7.2f}  Distance: {tp2_pct} ({tp2_ticks})"
+_TARGET3_ROW = "Target 3 @ {target3:<7.2f}  Distance: {tp3_pct} ({tp3_ticks})"
+_STOP_ROW = "Stop Loss @ {stop:<7.2f}  Distance: {sl_pct} ({sl_ticks})"
+_BREAK_EVEN_ROW = "Break-Even @ {stop:<7.2f}  Distance: {sl_pct} ({sl_ticks})"
+_PROFIT_LOCK_ROW = "Profit Lock Stop @ {stop:<7.2f}  Distance: {sl_pct}"
+_TRAILING_ROW = "Trailing Stop: ${stop} trail amount"
+_FILLED_ROWS = tuple(f"Target {n}: ✓ FILLED" for n in (1, 2, 3))
+
+_OPEN_TRADE_ROWS = {
+    ("Initial", False): (_STOP_ROW, _TARGET1_ROW, _TARGET2_ROW),
+    ("Initial", True): (_STOP_ROW, _TARGET1_ROW, _TARGET2_ROW, _TARGET3_ROW),
+    ("Partial1", False): (_BREAK_EVEN_ROW, _TARGET2_ROW, _FILLED_ROWS[0]),
+    ("Partial1", True): (
+        _BREAK_EVEN_ROW,
+        _TARGET2_ROW,
+        _TARGET3_ROW,
+        _FILLED_ROWS[0],
+    ),
+    ("Partial2", False): (_TRAILING_ROW,) + _FILLED_ROWS[:2],
+    ("Partial2", True): (_PROFIT_LOCK_ROW, _TARGET3_ROW) + _FILLED_ROWS[:2],
+}
+_STATUS_LAYOUTS = {
+    key: (_HEADER_ROWS, _PNL_ROWS + (_DOLLAR_PNL_ROW,), rows)
+    for key, rows in _OPEN_TRADE_ROWS.items()
+}
+_STATUS_LAYOUTS["Complete", False] = _STATUS_LAYOUTS["Complete", True] = (
+    _HEADER_ROWS,
+    _PNL_ROWS,
+    _FILLED_ROWS + ("TRADE COMPLETED",),
+)
+
+# Widest values the rows normally show, to size the box at import; a row
+# that still comes out wider is cut at the border rather than pushing it out
+_BOX_SAMPLE_FIELDS = dict(
+    symbol="XXXXXXX",
+    direction="SHORT",
+    shares=9999,
+    stage="Partial2",
+    entry=9999.99,
+    current=9999.99,
+    pnl_sign="+",
+    points_pnl=999.99,
+    pct_pnl=99.99,
+    dollar_pnl=99999.99,
+    stop=9999.99,
+    target1=9999.99,
+    target2=9999.99,
+    target3=9999.99,
+    **{f"{name}_pct": "99.99%" for name in ("tp1", "tp2", "tp3", "sl")},
+    **{f"{name}_ticks": "99999 ticks" for name in ("tp1", "tp2", "tp3", "sl")},
+)
+_BOX_WIDTH = max(
+    len(row.format_map(_BOX_SAMPLE_FIELDS))
+    for layout in _STATUS_LAYOUTS.values()
+    for rows in layout
+    for row in rows
+)
+_BOX_TOP = "╔{:═^{}}╗".format(" TRADE STATUS ", _BOX_WIDTH + 2)
+_BOX_DIVIDER = "╠{}╣".format("═" * (_BOX_WIDTH + 2))
+_BOX_BOTTOM = "╚{}╝".format("═" * (_BOX_WIDTH + 2))
+_BOX_ROW = "║ {:<%d.%d} ║" % (_BOX_WIDTH, _BOX_WIDTH)
+
+
+# Distances each layout actually shows, so display_trade_status only works
+# out those (tp1 = target 1, ..., sl = stop)
+_STATUS_DISTANCES = {
+    key: tuple(
+        name
+        for name in ("tp1", "tp2", "tp3", "sl")
+        if any("{%s_pct}" % name in row for rows in layout for row in rows)
+    )
+    for key, layout in _STATUS_LAYOUTS.items()
+}
+
+
+def _render_status_box(sections, fields):
+    """Format each row of the layout into the box, dividers between sections"""
+    lines = ["", _BOX_TOP]
+    for i, rows in enumerate(sections):
+        if i:
+            lines.append(_BOX_DIVIDER)
+        lines.extend(_BOX_ROW.format(row.format_map(fields)) for row in rows)
+    lines.append(_BOX_BOTTOM)
+    return "\n".join(lines)
+
+
 def display_trade_status(
+    symbol,
     current_price,
     entry_price,
     stop_price,
@@ -147,194 +222,283 @@ def display_trade_status(
     partial3_target=None,
 ):
     """Display comprehensive trade status"""
+    # Skip all the formatting when the status would not be logged anyway
+    if not logging.getLogger().isEnabledFor(logging.INFO):
+        return
+
     # Calculate P&L
     if direction == "long":
         points_pnl = current_price - entry_price
-        pct_pnl = (points_pnl / entry_price) * 100
     else:  # short
         points_pnl = entry_price - current_price
-        pct_pnl = (points_pnl / entry_price) * 100
-
-    # Calculate dollar P&L
-    dollar_pnl = points_pnl * remaining_shares
-
-    # Format P&L with colors (+ for green, - for red)
-    pnl_sign = "+" if points_pnl >= 0 else ""
+    pct_pnl = (points_pnl / entry_price) * 100
+
+    fields = dict(
+        symbol=symbol,
+        direction=direction.upper(),
+        shares=remaining_shares,
+        stage=trade_stage,
+        entry=entry_price,
+        current=current_price,
+        # Format P&L with colors (+ for green, - for red)
+        pnl_sign="+" if points_pnl >= 0 else "",
+        points_pnl=points_pnl,
+        pct_pnl=pct_pnl,
+        dollar_pnl=points_pnl * remaining_shares,
+        stop=stop_price,
+        target1=partial1_target,
+        target2=partial2_target,
+        target3=partial3_target or 0,
+    )
 
-    # Calculate distances to targets and stop
-    if trade_stage == "Initial":
-        tp1_pct, tp1_ticks = get_price_distance(
-            current_price, partial1_target, direction
-        )
-        tp2_pct, tp2_ticks = get_price_distance(
-            current_price, partial2_target, direction
-        )
-        tp3_pct, tp3_ticks = (
-            get_price_distance(current_price, partial3_target or 0, direction)
-            if partial3_target
-            else ("N/A", "N/A")
+    # Calculate distances to the targets and stop shown at this stage only
+    key = trade_stage, bool(partial3_target)
+    prices = {
+        "tp1": partial1_target,
+        "tp2": partial2_target,
+        "tp3": partial3_target,
+        "sl": stop_price,
+    }
+    for name in _STATUS_DISTANCES[key]:
+        fields[f"{name}_pct"], fields[f"{name}_ticks"] = get_price_distance(
+            current_price, prices[name], direction
         )
-        sl_pct, sl_ticks = get_price_distance(current_price, stop_price, direction)
-
-        status_str = f"""
-╔════════════════ TRADE STATUS ════════════════╗
-║ Symbol: {stock.symbol:<7}  Direction: {direction.upper():<5}  Shares: {remaining_shares:<4} ║
-║ Stage: {trade_stage:<7}                              ║
-╠═══════════════════════════════════════════════╣
-║ Entry: {entry_price:<7.2f}    Current: {current_price:<7.2f}           ║
-║ P&L:   {pnl_sign}{points_pnl:<+7.2f} pts ({pnl_sign}{pct_pnl:.2f}%)              ║
-║ P&L:   ${pnl_sign}{dollar_pnl:.2f} (approx. {remaining_shares} shares)       ║
-╠═══════════════════════════════════════════════╣
-║ Stop Loss @ {stop_price:<7.2f}  Distance: {sl_pct} ({sl_ticks})  ║
-║ Target 1 @ {partial1_target:<7.2f}  Distance: {tp1_pct} ({tp1_ticks})  ║
-║ Target 2 @ {partial2_target:<7.2f}  Distance: {tp2_pct} ({tp2_ticks})  ║
-"""
-        # Add third target if present
-        if partial3_target:
-            status_str += f"║ Target 3 @ {partial3_target:<7.2f}  Distance: {tp3_pct} ({tp3_ticks})  ║\n"
-
-        status_str += "╚═══════════════════════════════════════════════╝\n"
-
-    elif trade_stage == "Partial1":
-        tp2_pct, tp2_ticks = get_price_distance(
-            current_price, partial2_target, direction
-        )
-        tp3_pct, tp3_ticks = (
-            get_price_distance(current_price, partial3_target or 0, direction)
-            if partial3_target
-            else ("N/A", "N/A")
-        )
-        sl_pct, sl_ticks = get_price_distance(current_price, stop_price, direction)
-
-        status_str = f"""
-╔════════════════ TRADE STATUS ════════════════╗
-║ Symbol: {stock.symbol:<7}  Direction: {direction.upper():<5}  Shares: {remaining_shares:<4} ║
-║ Stage: {trade_stage:<7}                              ║
-╠═══════════════════════════════════════════════╣
-║ Entry: {entry_price:<7.2f}    Current: {current_price:<7.2f}           ║
-║ P&L:   {pnl_sign}{points_pnl:<+7.2f} pts ({pnl_sign}{pct_pnl:.2f}%)              ║
-║ P&L:   ${pnl_sign}{dollar_pnl:.2f} (approx. {remaining_shares} shares)       ║
-╠═══════════════════════════════════════════════╣
-║ Break-Even @ {stop_price:<7.2f}  Distance: {sl_pct} ({sl_ticks})  ║
-║ Target 2 @ {partial2_target:<7.2f}  Distance: {tp2_pct} ({tp2_ticks})  ║
-"""
-        # Add third target if present
-        if partial3_target:
-            status_str += f"║ Target 3 @ {partial3_target:<7.2f}  Distance: {tp3_pct} ({tp3_ticks})  ║\n"
-
-        status_str += "║ Target 1: ✓ FILLED                             ║\n"
-        status_str += "╚═══════════════════════════════════════════════╝\n"
-
-    elif trade_stage == "Partial2":
-        if partial3_target:
-            tp3_pct, tp3_ticks = get_price_distance(
-                current_price, partial3_target, direction
+
+    logging.info("\n%s", _render_status_box(_STATUS_LAYOUTS[key], fields))
+
+
+def to_ticks(price):
+    """Round a price to a whole number of ticks"""
+    return round(price * TICKS_PER_DOLLAR)
+
+
+def split_shares(share_size, parts):
+    """Split share_size into parts whole chunks that add up to it exactly,
+    with the remainder going to the latest chunks (100 -> [33, 33, 34]), so
+    small sizes leave the early chunks empty rather than the last one"""
+    q, r = divmod(share_size, parts)
+    return [q + 1 if i >= parts - r else q for i in range(parts)]
+
+
+@dataclass
+class TradeState:
+    """Mutable state shared by the manage_trade stage handlers"""
+
+    stock: Contract
+    entry_price: float
+    risk_amount: float
+    sign: int
+    partial1_target: float
+    partial2_target: float
+    partial3_target: float
+    # Targets and live stop in ticks, for the per-tick comparisons
+    partial1_ticks: int
+    partial2_ticks: int
+    partial3_ticks: int
+    stop_ticks: int
+    partial_sizes: list  # Shares for each partial still to take, in order
+    remaining_shares: int
+    current_stop_price: float
+    # Exit order template, built once per trade; each exit only fills in its
+    # size on a copy
+    market_exit: Order
+    target_hit: object
+    stop_loss_order: Order  # The one live stop, modified in place as it moves
+    partial_size: int = 0  # Shares in the partial most recently taken
+
+    def take_partial(self, new_stop_price):
+        """Send the next partial and move the live stop to new_stop_price for
+        the shares left after it. Returns the partial trade, or None when the
+        partial is empty and only the stop moves"""
+        self.partial_size = self.partial_sizes.pop(0)
+        partial_trade = None
+        if self.partial_size:  # TWS rejects zero-quantity orders
+            partial_order = dataclasses.replace(
+                self.market_exit, totalQuantity=self.partial_size
             )
-            sl_pct, sl_ticks = get_price_distance(current_price, stop_price, direction)
-
-            status_str = f"""
-╔════════════════ TRADE STATUS ════════════════╗
-║ Symbol: {stock.symbol:<7}  Direction: {direction.upper():<5}  Shares: {remaining_shares:<4} ║
-║ Stage: {trade_stage:<7}                              ║
-╠═══════════════════════════════════════════════╣
-║ Entry: {entry_price:<7.2f}    Current: {current_price:<7.2f}           ║
-║ P&L:   {pnl_sign}{points_pnl:<+7.2f} pts ({pnl_sign}{pct_pnl:.2f}%)              ║
-║ P&L:   ${pnl_sign}{dollar_pnl:.2f} (approx. {remaining_shares} shares)       ║
-╠═══════════════════════════════════════════════╣
-║ Profit Lock Stop @ {stop_price:<7.2f}  Distance: {sl_pct}   ║
-║ Target 3 @ {partial3_target:<7.2f}  Distance: {tp3_pct} ({tp3_ticks})  ║
-║ Target 1: ✓ FILLED                             ║
-║ Target 2: ✓ FILLED                             ║
-╚═══════════════════════════════════════════════╝
-"""
-        else:
-            # If no third target, show trailing stop info
-            status_str = f"""
-╔════════════════ TRADE STATUS ════════════════╗
-║ Symbol: {stock.symbol:<7}  Direction: {direction.upper():<5}  Shares: {remaining_shares:<4} ║
-║ Stage: {trade_stage:<7}                              ║
-╠═══════════════════════════════════════════════╣
-║ Entry: {entry_price:<7.2f}    Current: {current_price:<7.2f}           ║
-║ P&L:   {pnl_sign}{points_pnl:<+7.2f} pts ({pnl_sign}{pct_pnl:.2f}%)              ║
-║ P&L:   ${pnl_sign}{dollar_pnl:.2f} (approx. {remaining_shares} shares)       ║
-╠═══════════════════════════════════════════════╣
-║ Trailing Stop: ${stop_price} trail amount           ║
-║ Target 1: ✓ FILLED                             ║
-║ Target 2: ✓ FILLED                             ║
-╚═══════════════════════════════════════════════╝
-"""
-    elif trade_stage == "Complete":
-        status_str = f"""
-╔════════════════ TRADE STATUS ════════════════╗
-║ Symbol: {stock.symbol:<7}  Direction: {direction.upper():<5}  Shares: {remaining_shares:<4} ║
-║ Stage: {trade_stage:<7}                              ║
-╠═══════════════════════════════════════════════╣
-║ Entry: {entry_price:<7.2f}    Current: {current_price:<7.2f}           ║
-║ P&L:   {pnl_sign}{points_pnl:<+7.2f} pts ({pnl_sign}{pct_pnl:.2f}%)              ║
-╠═══════════════════════════════════════════════╣
-║ Target 1: ✓ FILLED                             ║
-║ Target 2: ✓ FILLED                             ║
-║ Target 3: ✓ FILLED                             ║
-║ TRADE COMPLETED                                 ║
-╚═══════════════════════════════════════════════╝
-"""
-
-    # Fix the display to ensure right borders align correctly
-    fixed_lines = []
-    for line in status_str.split("\n"):
-        if "║" in line:
-            # Ensure line is exactly 49 characters wide (including borders)
-            content = line.strip()
-            if len(content) < 49:
-                padding = " " * (49 - len(content))
-                # Find the last '║' and replace it with '║' + padding
-                last_idx = content.rfind("║")
-                if last_idx != -1:
-                    content = content[:last_idx] + padding + "║"
-            fixed_lines.append(content)
-        else:
-            fixed_lines.append(line)
+            partial_trade = ib.placeOrder(self.stock, partial_order)
+
+        # Placing the stop again under its own orderId modifies it in TWS, so
+        # the position is never left without a stop between cancel and place
+        self.stop_loss_order.totalQuantity = self.remaining_shares - self.partial_size
+        self.stop_loss_order.auxPrice = new_stop_price
+        ib.placeOrder(self.stock, self.stop_loss_order)
+
+        self.remaining_shares -= self.partial_size
+        self.current_stop_price = new_stop_price  # Update for status display
+        self.stop_ticks = to_ticks(new_stop_price)
+        return partial_trade
+
+    async def confirm_partial(self, partial_trade, label):
+        """Wait for partial to fill, then correct the share count from the
+        fill TWS reports on the order itself. A partial still working after
+        the wait is cancelled first, so no late fill can follow the count"""
+        if partial_trade is None:
+            return
+        if not await wait_for_fill(partial_trade, timeout=2):
+            ib.cancelOrder(partial_trade.order)
+            await wait_for_cancel(partial_trade)
+        filled = int(partial_trade.orderStatus.filled)
+        if filled != self.partial_size:
+            logging.info(
+                "%s partial filled %s of %s shares", label, filled, self.partial_size
+            )
+            self.remaining_shares += self.partial_size - filled
+            # Put the unsold shares back under the stop
+            self.stop_loss_order.totalQuantity = self.remaining_shares
+            ib.placeOrder(self.stock, self.stop_loss_order)
 
-    fixed_status = "\n".join(fixed_lines)
-    logging.info(f"\n{fixed_status}")
-    return
 
+async def on_tick_initial(state, current_ticks):
+    """Take the first partial and move the stop to break-even"""
+    if not state.target_hit(current_ticks, state.partial1_ticks):
+        return "Initial"
 
-def manage_trade(
-    entry_price, trade, stop_loss_order, direction, share_size, risk_amount, stock
-):
-    logging.info(f"Managing {direction} trade...")
+    logging.info("First partial take profit target hit.")
+    partial_trade = state.take_partial(state.entry_price)
+    logging.info("Partial order of %s shares placed.", state.partial_size)
+    logging.info("Stop loss moved to break-even at %s", state.current_stop_price)
 
-    # Set profit targets using the dynamic risk amount
-    partial1_target = (
-        entry_price + (1.5 * risk_amount)
-        if direction == "long"
-        else entry_price - (1.5 * risk_amount)
-    )
-    partial2_target = (
-        entry_price + (3 * risk_amount)
-        if direction == "long"
-        else entry_price - (3 * risk_amount)
+    await state.confirm_partial(partial_trade, "First")
+    return "Partial1"
+
+
+async def on_tick_partial1(state, current_ticks):
+    """Take the second partial and lock in 1R of profit on the rest"""
+    if not state.target_hit(current_ticks, state.partial2_ticks):
+        return "Partial1"
+
+    logging.info("Second partial take profit target hit.")
+    # Set tighter stop for remaining shares - move stop to entry + 1R for long or entry - 1R for short
+    partial_trade = state.take_partial(
+        state.entry_price + state.sign * state.risk_amount
     )
-    partial3_target = (
-        entry_price + (5 * risk_amount)
-        if direction == "long"
-        else entry_price - (5 * risk_amount)
+    logging.info("Partial order of %s shares placed.", state.partial_size)
+    logging.info(
+        "Stop loss moved to profit-lock at %s for remaining %s shares.",
+        state.current_stop_price,
+        state.remaining_shares,
     )
 
+    await state.confirm_partial(partial_trade, "Second")
+    return "Partial2"
+
+
+async def on_tick_partial2(state, current_ticks):
+    """Close the remaining shares at the final target"""
+    if not state.target_hit(current_ticks, state.partial3_ticks):
+        return "Partial2"
+
+    logging.info("Third/Final target hit.")
+    # Take the final portion
+    final_order = dataclasses.replace(
+        state.market_exit, totalQuantity=state.remaining_shares
+    )
+    final_trade = ib.placeOrder(state.stock, final_order)
+    stop_trade = ib.cancelOrder(state.stop_loss_order)  # Remove the profit-lock stop
     logging.info(
-        f"Profit targets - First: {partial1_target}, Second: {partial2_target}, Third: {partial3_target}"
+        "Final order of %s shares placed. Exiting trade completely.",
+        state.remaining_shares,
     )
 
-    # Initial position setup
-    remaining_shares = share_size
-    first_partial = False
-    second_partial = False
-    partial_size = math.ceil(share_size / 3)  # Divide into three equal parts
+    state.remaining_shares = 0
 
-    # Current stop price (initially)
-    current_stop_price = (
-        entry_price - risk_amount if direction == "long" else entry_price + risk_amount
+    # The exit and the cancel are independent, so wait for both at once
+    waits = [wait_for_fill(final_trade)]
+    if stop_trade is not None:
+        waits.append(wait_for_cancel(stop_trade))
+    await asyncio.gather(*waits)
+    return "Complete"
+
+
+def simulate_test_price(state, trade_stage, elapsed_seconds, current_price):
+    """TEST MODE: move price just past the next target (or past the stop)
+    on a fixed schedule, so every stage fires without waiting for the market"""
+    sign = state.sign
+
+    # After 5 seconds, trigger first partial
+    if elapsed_seconds > 5 and trade_stage == "Initial":
+        logging.info("TEST MODE: Simulating price movement to trigger first partial")
+        return state.partial1_target + sign * 0.01  # Just past first target
+
+    # After 10 seconds, trigger second partial
+    if elapsed_seconds > 10 and trade_stage == "Partial1":
+        logging.info("TEST MODE: Simulating price movement to trigger second partial")
+        return state.partial2_target + sign * 0.01  # Just past second target
+
+    # After 15 seconds, trigger third partial or trailing stop
+    if elapsed_seconds > 15 and trade_stage == "Partial2":
+        logging.info("TEST MODE: Simulating price movement to trigger third target")
+        return state.partial3_target + sign * 0.01  # Just past third target
+
+    # After 20 seconds, simulate stop loss if still have shares
+    if elapsed_seconds > 20 and state.remaining_shares > 0:
+        logging.info("TEST MODE: Simulating price movement to trigger trailing stop")
+        return state.entry_price - sign * 2 * state.risk_amount  # Past stop
+
+    return current_price
+
+
+# Each handler checks only the target for its own stage and returns the next stage
+STAGE_HANDLERS = {
+    "Initial": on_tick_initial,
+    "Partial1": on_tick_partial1,
+    "Partial2": on_tick_partial2,
+}
+
+
+async def manage_trade(
+    entry_price,
+    trade,
+    stop_loss_order,
+    direction,
+    share_size,
+    risk_amount,
+    stock,
+    test_mode=False,
+):
+    logging.info("Managing %s trade...", direction)
+
+    # Direction never changes during the trade, so pick the comparisons once
+    if direction == "long":
+        sign = 1
+        target_hit, stop_hit = operator.ge, operator.le
+        exit_action = "SELL"
+    else:
+        sign = -1
+        target_hit, stop_hit = operator.le, operator.ge
+        exit_action = "BUY"
+
+    # Set profit targets using the dynamic risk amount, signed by direction
+    partial1_target = entry_price + sign * 1.5 * risk_amount
+    partial2_target = entry_price + sign * 3 * risk_amount
+    partial3_target = entry_price + sign * 5 * risk_amount
+
+    logging.info(
+        "Profit targets - First: %s, Second: %s, Third: %s",
+        partial1_target,
+        partial2_target,
+        partial3_target,
+    )
+
+    state = TradeState(
+        stock=stock,
+        entry_price=entry_price,
+        risk_amount=risk_amount,
+        sign=sign,
+        partial1_target=partial1_target,
+        partial2_target=partial2_target,
+        partial3_target=partial3_target,
+        partial1_ticks=to_ticks(partial1_target),
+        partial2_ticks=to_ticks(partial2_target),
+        partial3_ticks=to_ticks(partial3_target),
+        stop_ticks=to_ticks(entry_price - sign * risk_amount),
+        partial_sizes=split_shares(share_size, 3),
+        remaining_shares=share_size,
+        current_stop_price=entry_price - sign * risk_amount,
+        market_exit=Order(action=exit_action, orderType="MKT"),
+        target_hit=target_hit,
+        stop_loss_order=stop_loss_order,
     )
 
     # Trade stage tracking
@@ -344,289 +508,170 @@ def manage_trade(
     display_counter = 0
 
     # For testing purposes - record starting time to simulate price movement
-    start_time = time.time()
+    start_time = time.monotonic()
 
     # Flag to check if trade was manually modified by user
-    manual_modification_check_time = time.time()
-
-    # Main trade management loop
-    while remaining_shares > 0:
-        # Check portfolio for current position
-        portfolio = ib.portfolio()
-        position_exists = False
-        actual_position_size = 0
-
-        for item in portfolio:
-            if item.contract.symbol == stock.symbol:
-                position_exists = True
-                # For long positions, we want positive size
-                if direction == "long":
-                    actual_position_size = max(0, int(item.position))
-                # For short positions, we want the absolute value of negative size
-                else:
-                    actual_position_size = abs(min(0, int(item.position)))
-
-                if actual_position_size == 0:
-                    logging.info("Position is 0. Exiting trade management.")
-                    return  # Exit the function if the position is 0
-
-                # Check if position was manually modified (every 10 seconds)
-                if time.time() - manual_modification_check_time > 10:
-                    if actual_position_size != remaining_shares:
-                        logging.info(
-                            f"Position size changed from {remaining_shares} to {actual_position_size} - likely manual modification"
-                        )
-                        remaining_shares = actual_position_size
-                    manual_modification_check_time = time.time()
-
-        if not position_exists:
-            logging.info("Position not found in portfolio. Exiting trade management.")
-            return
+    manual_modification_check_time = time.monotonic()
 
-        # Get latest price
-        ticker = ib.reqTickers(stock)[0]
-        current_price = (
-            ticker.marketPrice() if ticker.marketPrice() != 0 else ticker.last
-        )
+    # Subscribe once; the ticker wakes the loop whenever a new tick arrives
+    ticker = ib.reqMktData(stock, "", False, False)
+    tick_event = asyncio.Event()
 
-        # TEST MODE: Simulate price movement to trigger take profit orders faster
-        elapsed_seconds = time.time() - start_time
+    def on_tick(updated_ticker):
+        tick_event.set()
 
-        if TEST_MODE:
-            # After 5 seconds, trigger first partial
-            if elapsed_seconds > 5 and not first_partial:
-                logging.info(
-                    "TEST MODE: Simulating price movement to trigger first partial"
-                )
-                if direction == "long":
-                    current_price = partial1_target + 0.01  # Just above target
-                else:
-                    current_price = partial1_target - 0.01  # Just below target
+    ticker.updateEvent += on_tick
 
-            # After 10 seconds, trigger second partial
-            elif elapsed_seconds > 10 and first_partial and not second_partial:
-                logging.info(
-                    "TEST MODE: Simulating price movement to trigger second partial"
-                )
-                if direction == "long":
-                    current_price = partial2_target + 0.01  # Just above target
-                else:
-                    current_price = partial2_target - 0.01  # Just below target
+    # TWS pushes position changes for the symbol, so track its size locally
+    # instead of scanning the whole portfolio on every pass
+    position_size = None  # Signed size as reported by TWS, None until seen
+    for position in ib.positions():
+        if position.contract.symbol == stock.symbol:
+            position_size = position.position
 
-            # After 15 seconds, trigger third partial or trailing stop
-            elif elapsed_seconds > 15 and second_partial:
-                logging.info(
-                    "TEST MODE: Simulating price movement to trigger third target"
-                )
-                if direction == "long":
-                    current_price = partial3_target + 0.01  # Just above target
-                else:
-                    current_price = partial3_target - 0.01  # Just below target
+    def on_position(position):
+        nonlocal position_size
+        if position.contract.symbol == stock.symbol:
+            position_size = position.position
 
-            # After 20 seconds, simulate stop loss if still have shares
-            elif elapsed_seconds > 20 and remaining_shares > 0:
+    ib.positionEvent += on_position
+
+    try:
+        # Main trade management loop
+        while state.remaining_shares > 0:
+            # Sleep until the ticker reports a new tick
+            try:
+                await asyncio.wait_for(tick_event.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                # Without a new tick only the test-mode simulation, which runs
+                # on the clock, has anything to do
+                if not test_mode:
+                    continue
+            tick_event.clear()
+
+            if position_size is None:
                 logging.info(
-                    "TEST MODE: Simulating price movement to trigger trailing stop"
+                    "Position not found in portfolio. Exiting trade management."
                 )
-                if direction == "long":
-                    current_price = entry_price - (2 * risk_amount)  # Below stop
-                else:
-                    current_price = entry_price + (2 * risk_amount)  # Above stop
-
-        # Display status periodically
-        display_counter += 1
-        if display_counter >= 5:
-            # Update display to include third target if needed
-            display_trade_status(
-                current_price,
-                entry_price,
-                current_stop_price,
-                partial1_target,
-                partial2_target,
-                direction,
-                remaining_shares,
-                trade_stage,
-                partial3_target,
-            )
-            display_counter = 0
+                return
 
-        # First partial take profit
-        if not first_partial and (
-            (
-                current_price >= partial1_target
-                if direction == "long"
-                else current_price <= partial1_target
-            )
-        ):
-            logging.info("First partial take profit target hit.")
-            # Take partial of partial_size shares
-            partial_action = "SELL" if direction == "long" else "BUY"
-            partial_order1 = MarketOrder(partial_action, partial_size)
-            ib.placeOrder(stock, partial_order1)
-            ib.cancelOrder(stop_loss_order)  # Remove initial stop
-            logging.info(
-                f"Partial order of {partial_size} shares placed and initial stop loss canceled."
-            )
+            # Shares held in the trade's direction; 0 once flat or flipped
+            actual_position_size = max(0, sign * int(position_size))
 
-            # Adjust stop to break-even
-            new_stop_price = entry_price
-            stop_action = "SELL" if direction == "long" else "BUY"
-            break_even_stop = StopOrder(
-                stop_action, remaining_shares - partial_size, new_stop_price
-            )
-            ib.placeOrder(stock, break_even_stop)
-            logging.info(f"Break-even stop loss order placed at {new_stop_price}")
-
-            # Update state
-            remaining_shares -= partial_size
-            first_partial = True  # Ensure first partial is only taken once
-            stop_loss_order = break_even_stop  # Update the current stop reference
-            current_stop_price = new_stop_price  # Update for status display
-            trade_stage = "Partial1"  # Update stage for display purposes
-
-            # Wait for partial to fill and verify position size
-            ib.sleep(2)
-            for item in portfolio:
-                if item.contract.symbol == stock.symbol:
-                    actual_size = (
-                        abs(item.position) if direction == "short" else item.position
-                    )
-                    if actual_size != remaining_shares:
-                        logging.info(
-                            f"Position size after first partial: {actual_size}, expected {remaining_shares}"
-                        )
-                        remaining_shares = actual_size
-
-        # Second partial take profit
-        elif (
-            first_partial
-            and not second_partial
-            and (
-                (
-                    current_price >= partial2_target
-                    if direction == "long"
-                    else current_price <= partial2_target
-                )
-            )
-        ):
-            logging.info("Second partial take profit target hit.")
-            # Take another partial of partial_size shares
-            partial_action = "SELL" if direction == "long" else "BUY"
-            partial_order2 = MarketOrder(partial_action, partial_size)
-            ib.placeOrder(stock, partial_order2)
-            ib.cancelOrder(stop_loss_order)  # Remove break-even stop
-            logging.info(
-                f"Partial order of {partial_size} shares placed and break-even stop loss canceled."
-            )
+            if actual_position_size == 0:
+                logging.info("Position is 0. Exiting trade management.")
+                return  # Exit the function if the position is 0
 
-            # Set tighter stop for remaining shares - move stop to entry + 1R for long or entry - 1R for short
-            new_stop_price = (
-                entry_price + risk_amount
-                if direction == "long"
-                else entry_price - risk_amount
-            )
-            stop_action = "SELL" if direction == "long" else "BUY"
-            profit_lock_stop = StopOrder(
-                stop_action, remaining_shares - partial_size, new_stop_price
-            )
-            ib.placeOrder(stock, profit_lock_stop)
-            logging.info(
-                f"Profit-lock stop order placed at {new_stop_price} for remaining {remaining_shares - partial_size} shares."
-            )
+            # One monotonic reading per pass serves every timer below
+            now = time.monotonic()
 
-            # Update state
-            remaining_shares -= partial_size
-            second_partial = True  # Mark second partial as complete
-            stop_loss_order = profit_lock_stop  # Update the current stop reference
-            current_stop_price = new_stop_price  # Update for status display
-            trade_stage = "Partial2"  # Update stage for display purposes
-
-            # Wait for partial to fill and verify position size
-            ib.sleep(2)
-            for item in portfolio:
-                if item.contract.symbol == stock.symbol:
-                    actual_size = (
-                        abs(item.position) if direction == "short" else item.position
+            # Check if position was manually modified (every 10 seconds)
+            if now - manual_modification_check_time > 10:
+                if actual_position_size != state.remaining_shares:
+                    logging.info(
+                        "Position size changed from %s to %s - likely manual modification",
+                        state.remaining_shares,
+                        actual_position_size,
                     )
-                    if actual_size != remaining_shares:
-                        logging.info(
-                            f"Position size after second partial: {actual_size}, expected {remaining_shares}"
-                        )
-                        remaining_shares = actual_size
-
-        # Third partial take profit - let the remaining shares run to the final target
-        elif second_partial and (
-            (
-                current_price >= partial3_target
-                if direction == "long"
-                else current_price <= partial3_target
-            )
-        ):
-            logging.info("Third/Final target hit.")
-            # Take the final portion
-            partial_action = "SELL" if direction == "long" else "BUY"
-            final_order = MarketOrder(partial_action, remaining_shares)
-            ib.placeOrder(stock, final_order)
-            ib.cancelOrder(stop_loss_order)  # Remove the profit-lock stop
-            logging.info(
-                f"Final order of {remaining_shares} shares placed. Exiting trade completely."
-            )
-
-            # Update state
-            remaining_shares = 0
-            trade_stage = "Complete"
-
-        # Check for stop loss
-        if (current_price <= current_stop_price and direction == "long") or (
-            current_price >= current_stop_price and direction == "short"
-        ):
-            logging.info(f"Stop loss at {current_stop_price} likely triggered.")
-
-            # Verify that position is actually closed by checking portfolio
-            ib.sleep(1)  # Wait a moment for the order to process
-            portfolio = ib.portfolio()
-            position_closed = True
-
-            for item in portfolio:
-                if item.contract.symbol == stock.symbol:
-                    if (direction == "long" and item.position > 0) or (
-                        direction == "short" and item.position < 0
-                    ):
-                        position_closed = False
-                        logging.info(
-                            f"Position still open after stop hit: {item.position} shares remaining"
-                        )
-                        remaining_shares = abs(item.position)
-                        break
-
-            if position_closed:
-                logging.info(
-                    "Position verified as closed - stop loss executed successfully"
+                    state.remaining_shares = actual_position_size
+                manual_modification_check_time = now
+
+            # Get latest price from the streaming ticker; it is updated in place,
+            # so this costs no request to TWS. marketPrice() is NaN (not 0)
+            # until quotes arrive, so fall back to the last trade on NaN.
+            current_price = ticker.marketPrice()
+            if math.isnan(current_price):
+                current_price = ticker.last
+
+            # TEST MODE: Simulate price movement to trigger take profit orders faster
+            if test_mode:
+                current_price = simulate_test_price(
+                    state, trade_stage, now - start_time, current_price
                 )
-                remaining_shares = 0
-            else:
-                # Force close the position if stop didn't trigger but should have
-                logging.warning(
-                    "Stop loss should have triggered but position still open - forcing close"
+
+            if math.isnan(current_price):
+                continue  # Nothing to act on until the first price arrives
+            current_ticks = to_ticks(current_price)
+
+            # Display status periodically
+            display_counter += 1
+            if display_counter >= 5:
+                # Update display to include third target if needed
+                display_trade_status(
+                    stock.symbol,
+                    current_price,
+                    entry_price,
+                    state.current_stop_price,
+                    partial1_target,
+                    partial2_target,
+                    direction,
+                    state.remaining_shares,
+                    trade_stage,
+                    partial3_target,
                 )
-                close_action = "SELL" if direction == "long" else "BUY"
-                close_order = MarketOrder(close_action, remaining_shares)
-                ib.placeOrder(stock, close_order)
+                display_counter = 0
+
+            # Dispatch to the handler for the current stage
+            trade_stage = await STAGE_HANDLERS[trade_stage](state, current_ticks)
+            if trade_stage == "Complete":
+                logging.info("All shares have been sold/bought back.")
+                break
+
+            # Check for stop loss
+            if stop_hit(current_ticks, state.stop_ticks):
                 logging.info(
-                    f"Emergency close order placed for remaining {remaining_shares} shares"
+                    "Stop loss at %s likely triggered.", state.current_stop_price
                 )
-                ib.sleep(2)  # Wait for the emergency close to execute
-                remaining_shares = 0
 
-            break
+                # Verify that position is actually closed from the position
+                # size TWS pushed while the stop order processed
+                await asyncio.sleep(1)  # Wait a moment for the order to process
+                position_closed = True
 
-        # Break if all shares are gone
-        if remaining_shares <= 0:
-            logging.info("All shares have been sold/bought back.")
-            break
+                if position_size is not None and sign * position_size > 0:
+                    position_closed = False
+                    logging.info(
+                        "Position still open after stop hit: %s shares remaining",
+                        position_size,
+                    )
+                    state.remaining_shares = abs(int(position_size))
 
-        # Sleep to reduce API calls
-        ib.sleep(1)
+                if position_closed:
+                    logging.info(
+                        "Position verified as closed - stop loss executed successfully"
+                    )
+                    state.remaining_shares = 0
+                else:
+                    # Force close the position if stop didn't trigger but should have
+                    logging.warning(
+                        "Stop loss should have triggered but position still open - forcing close"
+                    )
+                    # Pull the live stop first, so a late stop fill cannot
+                    # flip the position after the close
+                    ib.cancelOrder(state.stop_loss_order)
+                    close_order = dataclasses.replace(
+                        state.market_exit, totalQuantity=state.remaining_shares
+                    )
+                    close_trade = ib.placeOrder(stock, close_order)
+                    logging.info(
+                        "Emergency close order placed for remaining %s shares",
+                        state.remaining_shares,
+                    )
+                    # Wait for the emergency close to execute
+                    await wait_for_fill(close_trade, timeout=2)
+                    state.remaining_shares = 0
+
+                break
+
+            # Break if all shares are gone
+            if state.remaining_shares <= 0:
+                logging.info("All shares have been sold/bought back.")
+                break
+
+    finally:
+        ticker.updateEvent -= on_tick
+        ib.positionEvent -= on_position
+        ib.cancelMktData(stock)
 
     logging.info("Trade management complete.")
 
@@ -654,10 +699,15 @@ if __name__ == "__main__":
         if trade and entry_price and stop_loss_order:
             # Display trade information before management starts
             logging.info(
-                f"Trade entered at {entry_price} with risk amount of {risk_amount}"
+                "Trade entered at %s with risk amount of %s", entry_price, risk_amount
             )
             logging.info(
-                f"Initial stop loss at {entry_price - risk_amount if direction == 'long' else entry_price + risk_amount}"
+                "Initial stop loss at %s",
+                (
+                    entry_price - risk_amount
+                    if direction == "long"
+                    else entry_price + risk_amount
+                ),
             )
 
             # Targets for a 3-part strategy with the first target at 1.5R, second at 3R, and third at 5R
@@ -677,25 +727,28 @@ if __name__ == "__main__":
                 else entry_price - (5 * risk_amount)
             )
 
-            logging.info(f"Target 1: {first_target} (1.5R)")
-            logging.info(f"Target 2: {second_target} (3R)")
-            logging.info(f"Target 3: {third_target} (5R)")
+            logging.info("Target 1: %s (1.5R)", first_target)
+            logging.info("Target 2: %s (3R)", second_target)
+            logging.info("Target 3: %s (5R)", third_target)
 
             # Start trade management
-            manage_trade(
-                entry_price,
-                trade,
-                stop_loss_order,
-                direction,
-                share_size,
-                risk_amount,
-                stock,
+            ib.run(
+                manage_trade(
+                    entry_price,
+                    trade,
+                    stop_loss_order,
+                    direction,
+                    share_size,
+                    risk_amount,
+                    stock,
+                    TEST_MODE,
+                )
             )
         else:
             logging.warning("Trade entry failed, exiting.")
 
     except Exception as e:
-        logging.error(f"Error in main execution: {e}")
+        logging.error("Error in main execution: %s", e)
     finally:
         # Disconnect from API
         if ib.isConnected():
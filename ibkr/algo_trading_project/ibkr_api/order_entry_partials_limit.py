@@ -1,61 +1,86 @@
-import math
 import logging
 from ib_insync import *
 
-# Assumes 'ib' is a connected IB instance
-# Place entry, stop, and limit orders for partial exits
+from order_helpers import partition_shares, wait_for_entry_fill
 
+# Place entry, stop, and limit orders for partial exits on the caller's
+# connected IB client
 
-def place_entry_stop_and_targets(stock, direction, shares, entry_price, stop_dist):
+
+async def place_entry_stop_and_targets(
+    ib, stock, direction, shares, entry_price, stop_dist
+):
     action = "BUY" if direction == "long" else "SELL"
     stop_action = "SELL" if direction == "long" else "BUY"
     shares = abs(shares)
     logging.info(
-        f"Placing entry order: action={action}, shares={shares}, direction={direction}"
+        "Placing entry order: action=%s, shares=%s, direction=%s",
+        action,
+        shares,
+        direction,
+    )
+    # Each target rides on the entry with a stop slice of its own size, the
+    # pair linked in a reduce-on-fill OCA group (ocaType=2): whatever a target
+    # fills, even in part, TWS takes off its slice of the stop, so the stop
+    # never covers more shares than are still held and never fewer. Only the
+    # last child transmits, so TWS receives the whole group at once and
+    # activates the children on the entry fill
+    entry_order = MarketOrder(
+        action, shares, orderId=ib.client.getReqId(), transmit=False
     )
-    entry_order = MarketOrder(action, shares)
+    sign = 1 if direction == "long" else -1
+    brackets = []
+    for k, qty in enumerate(partition_shares(shares), start=1):
+        if not qty:  # TWS rejects zero-quantity orders
+            continue
+        oca = dict(
+            parentId=entry_order.orderId,
+            ocaGroup=f"oca_{entry_order.orderId}_{k}",
+            ocaType=2,
+            transmit=False,
+        )
+        limit_order = LimitOrder(
+            stop_action,
+            qty,
+            round(entry_price + sign * k * stop_dist, 2),
+            orderId=ib.client.getReqId(),
+            **oca,
+        )
+        stop_order = StopOrder(
+            stop_action,
+            qty,
+            round(entry_price - sign * stop_dist, 2),
+            orderId=ib.client.getReqId(),
+            **oca,
+        )
+        brackets.append((k, limit_order, stop_order))
+    brackets[-1][2].transmit = True
+
     trade = ib.placeOrder(stock, entry_order)
-    ib.sleep(2)
-    fill_price = trade.orderStatus.avgFillPrice or entry_price
-    stop_price = (
-        fill_price - stop_dist if direction == "long" else fill_price + stop_dist
+    for _, limit_order, stop_order in brackets:
+        ib.placeOrder(stock, limit_order)
+        ib.placeOrder(stock, stop_order)
+    fill_price = await wait_for_entry_fill(trade, entry_price)
+
+    # The children went out priced off the reference price; move them to the
+    # actual fill, modifying each in place under its own orderId
+    if fill_price != entry_price:
+        for k, limit_order, stop_order in brackets:
+            limit_order.lmtPrice = round(fill_price + sign * k * stop_dist, 2)
+            stop_order.auxPrice = round(fill_price - sign * stop_dist, 2)
+            for order in (limit_order, stop_order):
+                order.transmit = True
+                ib.placeOrder(stock, order)
+    logging.info(
+        "Entry filled at %s, %s target/stop pairs working",
+        fill_price,
+        len(brackets),
     )
-    stop_price = round(stop_price, 2)
-    stop_order = StopOrder(stop_action, shares, stop_price)
-    ib.placeOrder(stock, stop_order)
-    # Calculate targets and partial sizes
-    p1 = math.floor(shares * 0.3)
-    p2 = math.floor(shares * 0.4)
-    p3 = shares - p1 - p2
-    targets = [
-        (p1, fill_price + stop_dist if direction == "long" else fill_price - stop_dist),
-        (
-            p2,
-            (
-                fill_price + 2 * stop_dist
-                if direction == "long"
-                else fill_price - 2 * stop_dist
-            ),
-        ),
-        (
-            p3,
-            (
-                fill_price + 3 * stop_dist
-                if direction == "long"
-                else fill_price - 3 * stop_dist
-            ),
-        ),
-    ]
-    limit_orders = []
-    for qty, tgt in targets:
-        tgt = round(tgt, 2)
-        limit_action = "SELL" if direction == "long" else "BUY"
-        order = LimitOrder(limit_action, qty, tgt)
-        ib.placeOrder(stock, order)
-        limit_orders.append(order)
-    return trade, fill_price, stop_order, limit_orders
+    limit_orders = [limit_order for _, limit_order, _ in brackets]
+    stop_orders = [stop_order for _, _, stop_order in brackets]
+    return trade, fill_price, stop_orders, limit_orders
 
 
 # Example usage:
-# trade, fill_price, stop_order, limit_orders = place_entry_stop_and_targets(stock, 'long', 100, 50.0, 1.0)
-# Now monitor for stop or target fills and adjust/cancel orders as needed.
+# trade, fill_price, stop_orders, limit_orders = await place_entry_stop_and_targets(ib, stock, 'long', 100, 50.0, 1.0)
+# TWS cancels each stop slice when its target fills, so nothing needs managing.
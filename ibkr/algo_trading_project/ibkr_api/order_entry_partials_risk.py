@@ -3,8 +3,12 @@ Order entry script for IBKR with risk management and partials logic.
 """
 
 from ib_insync import *
+import asyncio
 import math
 import logging
+import time
+
+from order_helpers import partition_shares, wait_for_entry_fill
 
 # --- CONFIGURABLE PARAMETERS ---
 ACCOUNT_AMOUNT = 10000  # Default account size in USD
@@ -12,9 +16,23 @@ TRADE_RISK_PCT = 0.01  # % of account to risk per trade (e.g. 0.01 = 1%)
 PRICE_RISK_PCT = 0.003  # % of price for stop (e.g. 0.005 = 0.5%)
 MAX_RISK_PCT = 0.01  # Max % of account to risk (e.g. 0.01 = 1%)
 
+# Positions by conId, kept current by TWS position updates (including the
+# initial sync on connect), so lookups never scan ib.positions()
+_positions = {}
+
+
+def _on_position(position):
+    _positions[position.contract.conId] = position.position
+
+
+# Qualified stock contracts by symbol
+_contracts = {}
+
 # --- IBKR CONNECTION ---
+# Shared TWS API client; the __main__ block (or the importing script) connects
+# it, so importing this module never opens a socket
 ib = IB()
-ib.connect("127.0.0.1", 7497, clientId=2)
+ib.positionEvent += _on_position
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -29,7 +47,12 @@ def calc_shares(
     max_risk_pct=MAX_RISK_PCT,
 ):
     logging.debug(
-        f"calc_shares called with entry_price={entry_price}, account_amount={account_amount}, trade_risk_pct={trade_risk_pct}, price_risk_pct={price_risk_pct}, max_risk_pct={max_risk_pct}"
+        "calc_shares called with entry_price=%s, account_amount=%s, trade_risk_pct=%s, price_risk_pct=%s, max_risk_pct=%s",
+        entry_price,
+        account_amount,
+        trade_risk_pct,
+        price_risk_pct,
+        max_risk_pct,
     )
     risk_per_trade = min(account_amount * trade_risk_pct, account_amount * max_risk_pct)
     stop_dist = entry_price * price_risk_pct
@@ -40,193 +63,251 @@ def calc_shares(
     max_shares_by_equity = math.floor(account_amount / entry_price)
     shares = min(shares, max_shares_by_equity)
     logging.debug(
-        f"calc_shares result: shares={shares}, stop_dist={stop_dist}, risk_per_trade={risk_per_trade}"
+        "calc_shares result: shares=%s, stop_dist=%s, risk_per_trade=%s",
+        shares,
+        stop_dist,
+        risk_per_trade,
     )
     return max(shares, 1), stop_dist, risk_per_trade
 
 
-def place_entry_and_stop(stock, direction, shares, entry_price, stop_dist):
+async def place_entry_and_stop(stock, direction, shares, entry_price, stop_dist):
     action = "BUY" if direction == "long" else "SELL"
     stop_action = "SELL" if direction == "long" else "BUY"
     # Ensure shares is always positive
     shares = abs(shares)
     logging.info(
-        f"Placing entry order:stock={stock.symbol} action={action}, shares={shares}, direction={direction}"
+        "Placing entry order:stock=%s action=%s, shares=%s, direction=%s",
+        stock.symbol,
+        action,
+        shares,
+        direction,
     )
     if (direction == "long" and action != "BUY") or (
         direction == "short" and action != "SELL"
     ):
         logging.warning(
-            f"Direction/action mismatch: direction={direction}, action={action}"
+            "Direction/action mismatch: direction=%s, action=%s", direction, action
         )
     entry_order = MarketOrder(action, shares)
-    logging.debug(f"Sending entry order: {entry_order}")
+    logging.debug("Sending entry order: %s", entry_order)
     trade = ib.placeOrder(stock, entry_order)
-    ib.sleep(2)
-    fill_price = trade.orderStatus.avgFillPrice or entry_price
-    logging.debug(f"Entry order fill_price: {fill_price}")
-    stop_price = (
-        fill_price - stop_dist if direction == "long" else fill_price + stop_dist
-    )
-    stop_price = round(stop_price, 2)
+    fill_price = await wait_for_entry_fill(trade, entry_price)
+    logging.debug("Entry order fill_price: %s", fill_price)
+    sign = 1 if direction == "long" else -1
+    stop_price = round(fill_price - sign * stop_dist, 2)
     logging.info(
-        f"Placing stop order: action={stop_action}, shares={shares}, stop_price={stop_price}"
+        "Placing stop order: action=%s, shares=%s, stop_price=%s",
+        stop_action,
+        shares,
+        stop_price,
     )
     stop_order = StopOrder(stop_action, shares, stop_price)
-    logging.debug(f"Sending stop order: {stop_order}")
+    logging.debug("Sending stop order: %s", stop_order)
     ib.placeOrder(stock, stop_order)
     return trade, fill_price, stop_order
 
 
-def manage_partials(stock, direction, entry_price, stop_dist, shares, stop_order):
-    # Partial sizes
-    p1 = math.floor(shares * 0.3)
-    p2 = math.floor(shares * 0.4)
-    p3 = shares - p1 - p2
-    stop1 = stop_order
-    # Place limit orders for profit targets
-    if direction == "long":
-        t1_price = round(entry_price + stop_dist, 2)
-        t2_price = round(entry_price + 2 * stop_dist, 2)
-        t3_price = round(entry_price + 3 * stop_dist, 2)
-        action = "SELL"
-    else:
-        t1_price = round(entry_price - stop_dist, 2)
-        t2_price = round(entry_price - 2 * stop_dist, 2)
-        t3_price = round(entry_price - 3 * stop_dist, 2)
-        action = "BUY"
-    # Place all limit orders at once
-    t1_order = LimitOrder(action, p1, t1_price)
-    t2_order = LimitOrder(action, p2, t2_price)
-    t3_order = LimitOrder(action, p3, t3_price)
-    t1_trade = ib.placeOrder(stock, t1_order)
-    t2_trade = ib.placeOrder(stock, t2_order)
-    t3_trade = ib.placeOrder(stock, t3_order)
+async def manage_partials(
+    stock, direction, entry_price, stop_dist, shares, stop_order, ticker
+):
+    # Partial sizes, 30/40/30
+    p1, p2, p3 = partition_shares(shares)
+    stop = stop_order
+    # Direction never changes during the trade, so sign the R multiples once:
+    # targets sit at 1R/2R/3R and the stop steps BE -> 1R -> 2R behind them
+    sign = 1 if direction == "long" else -1
+    action = "SELL" if direction == "long" else "BUY"
+    t1_price, t2_price, t3_price = (
+        round(entry_price + sign * k * stop_dist, 2) for k in (1, 2, 3)
+    )
+    stop_prices = [round(entry_price + sign * k * stop_dist, 2) for k in (0, 1, 2)]
+    next_targets = [
+        f"T1 @ {t1_price}",
+        f"T2 @ {t2_price}",
+        f"T3 @ {t3_price}",
+        "No further targets",
+    ]
+    # The entry has already filled and the targets are priced off that fill,
+    # so there is no working parent to attach them to; unattached orders sent
+    # with transmit=False would sit untransmitted in TWS. They go out as plain
+    # orders, and the single stop is resized by on_fill below instead of being
+    # split into OCA slices. Small totals leave some partials empty;
+    # TWS rejects zero-quantity orders, so those targets get no order and
+    # count as filled once the fills reach them
+    t1_trade, t2_trade, t3_trade = (
+        ib.placeOrder(stock, LimitOrder(action, qty, price)) if qty else None
+        for qty, price in ((p1, t1_price), (p2, t2_price), (p3, t3_price))
+    )
+    target_trades = [t for t in (t1_trade, t2_trade, t3_trade) if t is not None]
     filled1 = filled2 = filled3 = False
-    while True:
-        ib.sleep(1)
-        # Get current price
-        md = ib.reqMktData(stock, "", False, False)
-        price = md.last or md.close
-        # Get current position
-        positions = ib.positions()
-        pos = 0.0
-        for p in positions:
-            if p.contract.conId == stock.conId:
-                pos = p.position
-                break
-        ####Logging #### Determine next target and stop for logging
-        if not filled1:
-            next_target = t1_price
-            next_target_str = f"T1 @ {t1_price}"
-        elif not filled2:
-            next_target = t2_price
-            next_target_str = f"T2 @ {t2_price}"
-        elif not filled3:
-            next_target = t3_price
-            next_target_str = f"T3 @ {t3_price}"
-        else:
-            next_target = None
-            next_target_str = "No further targets"
-        # Current stop value
-        if filled2:
-            stop_val = (
-                round(entry_price + 2 * stop_dist, 2)
-                if direction == "long"
-                else round(entry_price - 2 * stop_dist, 2)
-            )
-        elif filled1:
-            stop_val = (
-                round(entry_price + stop_dist, 2)
-                if direction == "long"
-                else round(entry_price - stop_dist, 2)
-            )
-        else:
-            stop_val = round(entry_price, 2)
+
+    def target_filled(target_trade, qty):
+        return target_trade is None or target_trade.orderStatus.filled >= qty
+
+    # TWS pushes ticks, fills and position changes; the handlers below react to
+    # them and set done once the trade is over, instead of polling every second
+    done = asyncio.Event()
+    last_status_log = 0.0
+    root_logger = logging.getLogger()
+
+    def on_tick(updated_ticker):
+        nonlocal last_status_log
+        # The ticks only feed the status line, so skip them when it is filtered
+        # out, and log it at most once a second, like the old loop did
+        if not root_logger.isEnabledFor(logging.INFO):
+            return
+        now = time.monotonic()
+        if now - last_status_log < 1:
+            return
+        last_status_log = now
+        price = updated_ticker.marketPrice()
+        ####Logging #### Targets fill in order, so the count picks the next one
+        targets_filled = filled1 + filled2 + filled3
         logging.info(
-            f"Actual price: {price}, Next target: {next_target_str}, Stop at: {stop_val}, Position: {pos}, R={stop_dist}"
+            "Actual price: %s, Next target: %s, Stop at: %s, Position: %s, R=%s",
+            price,
+            next_targets[targets_filled],
+            stop_prices[min(targets_filled, 2)],
+            _positions.get(stock.conId, 0.0),
+            stop_dist,
         )
+
+    def on_fill(filled_trade):
+        nonlocal filled1, filled2, filled3
         # Check order statuses
-        if not filled1 and t1_trade.orderStatus.filled >= p1:
+        if not filled1 and target_filled(t1_trade, p1):
             filled1 = True
-            # Move stop to BE
-            ib.cancelOrder(stop1)
-            stop_price = round(entry_price, 2)
-            stop1 = StopOrder(action, shares - p1, stop_price)
-            ib.placeOrder(stock, stop1)
+            # Move stop to BE, modifying the working stop in place
+            stop_price = stop_prices[0]
+            stop.totalQuantity = shares - p1
+            stop.auxPrice = stop_price
+            ib.placeOrder(stock, stop)
             logging.info(
-                f"Partial 1: Limit order filled for {p1} at {t1_price}, stop moved to BE {stop_price}"
+                "Partial 1: Limit order filled for %s at %s, stop moved to BE %s",
+                p1,
+                t1_price,
+                stop_price,
             )
-        if filled1 and not filled2 and t2_trade.orderStatus.filled >= p2:
+        if filled1 and not filled2 and target_filled(t2_trade, p2):
             filled2 = True
             # Move stop to 1R
-            ib.cancelOrder(stop1)
-            stop_price = (
-                round(entry_price + stop_dist, 2)
-                if direction == "long"
-                else round(entry_price - stop_dist, 2)
-            )
-            stop2 = StopOrder(action, shares - p1 - p2, stop_price)
-            ib.placeOrder(stock, stop2)
+            stop_price = stop_prices[1]
+            stop.totalQuantity = shares - p1 - p2
+            stop.auxPrice = stop_price
+            ib.placeOrder(stock, stop)
             logging.info(
-                f"Partial 2: Limit order filled for {p2} at {t2_price}, stop moved to 1R {stop_price}"
+                "Partial 2: Limit order filled for %s at %s, stop moved to 1R %s",
+                p2,
+                t2_price,
+                stop_price,
             )
-        if filled2 and not filled3 and t3_trade.orderStatus.filled >= p3:
+        if filled2 and not filled3 and target_filled(t3_trade, p3):
             filled3 = True
             # Move stop to 2R (for any remaining, but should be flat)
-            ib.cancelOrder(stop2)
-            stop_price = (
-                round(entry_price + 2 * stop_dist, 2)
-                if direction == "long"
-                else round(entry_price - 2 * stop_dist, 2)
-            )
-            stop3 = StopOrder(action, 0, stop_price)
+            ib.cancelOrder(stop)
+            stop_price = stop_prices[2]
             logging.info(
-                f"Partial 3: Limit order filled for {p3} at {t3_price}, stop moved to 2R {stop_price}"
+                "Partial 3: Limit order filled for %s at %s, stop moved to 2R %s",
+                p3,
+                t3_price,
+                stop_price,
             )
-            break
+            done.set()
+
+    def on_position(position):
         # Stop loss triggered (position closed)
-        if pos == 0.0:
+        if (
+            position.contract.conId == stock.conId
+            and position.position == 0.0
+            and not done.is_set()
+        ):
             logging.info(
                 "Position is 0.0, manual exit or stop loss triggered. Exiting trade management."
             )
             # Cancel all remaining limit orders
-            if not filled1:
-                ib.cancelOrder(t1_order)
-            if not filled2:
-                ib.cancelOrder(t2_order)
-            if not filled3:
-                ib.cancelOrder(t3_order)
-            break
+            for filled, target_trade in (
+                (filled1, t1_trade),
+                (filled2, t2_trade),
+                (filled3, t3_trade),
+            ):
+                if not filled and target_trade is not None:
+                    ib.cancelOrder(target_trade.order)
+            done.set()
+
+    ticker.updateEvent += on_tick
+    for target_trade in target_trades:
+        target_trade.filledEvent += on_fill
+    ib.positionEvent += on_position
+    try:
+        await done.wait()
+    finally:
+        ticker.updateEvent -= on_tick
+        for target_trade in target_trades:
+            target_trade.filledEvent -= on_fill
+        ib.positionEvent -= on_position
     logging.info("Trade management complete.")
 
 
-def run_strategy(symbol, direction="long"):
-    stock = Stock(symbol, "SMART", "USD")
-    ib.qualifyContracts(stock)
-    md = ib.reqMktData(stock, "", False, False)
-    ib.sleep(2)
-    entry_price = md.last or md.close
-    if entry_price is None or (
-        isinstance(entry_price, float) and (math.isnan(entry_price) or entry_price == 0)
-    ):
-        print(
-            f"ERROR: Could not retrieve a valid market price for {symbol}. Check your market data subscriptions and try again."
+async def get_stock(symbol):
+    # Qualify each symbol once per session; later runs reuse the resolved conId
+    stock = _contracts.get(symbol)
+    if stock is None:
+        stock = Stock(symbol, "SMART", "USD")
+        await ib.qualifyContractsAsync(stock)
+        if stock.conId:
+            _contracts[symbol] = stock
+    return stock
+
+
+async def run_strategy(symbol, direction="long"):
+    stock = await get_stock(symbol)
+    # One subscription serves the entry price and the whole trade management
+    ticker = ib.reqMktData(stock, "", False, False)
+    try:
+        # Take the first usable price as soon as it streams in, at most 2 seconds
+        entry_price = ticker.marketPrice()
+        deadline = time.monotonic() + 2
+        while not entry_price or math.isnan(entry_price):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(ticker.updateEvent, remaining)
+            except asyncio.TimeoutError:
+                break
+            entry_price = ticker.marketPrice()
+        if entry_price is None or (
+            isinstance(entry_price, float)
+            and (math.isnan(entry_price) or entry_price == 0)
+        ):
+            print(
+                f"ERROR: Could not retrieve a valid market price for {symbol}. Check your market data subscriptions and try again."
+            )
+            return
+        shares, stop_dist, _ = calc_shares(entry_price)
+        trade, fill_price, stop_order = await place_entry_and_stop(
+            stock, direction, shares, entry_price, stop_dist
         )
-        ib.disconnect()
-        return
-    shares, stop_dist, _ = calc_shares(entry_price)
-    trade, fill_price, stop_order = place_entry_and_stop(
-        stock, direction, shares, entry_price, stop_dist
-    )
-    manage_partials(stock, direction, fill_price, stop_dist, shares, stop_order)
-    logging.info(
-        f"Calculated shares={shares}, stop_dist={stop_dist}, entry_price={entry_price}"
-    )
+        await manage_partials(
+            stock, direction, fill_price, stop_dist, shares, stop_order, ticker
+        )
+        logging.info(
+            "Calculated shares=%s, stop_dist=%s, entry_price=%s",
+            shares,
+            stop_dist,
+            entry_price,
+        )
+    finally:
+        ib.cancelMktData(stock)
+
 
+async def run_strategies(symbols, direction="long"):
+    # Each symbol only waits on its own fills and ticks, so they run side by side
+    await asyncio.gather(*(run_strategy(symbol, direction) for symbol in symbols))
 
-0
 
 if __name__ == "__main__":
     logging.info("Script started as main.")
-    run_strategy("AMD", direction="long")
+    ib.connect("127.0.0.1", 7497, clientId=2)
+    ib.run(run_strategies(["AMD"], direction="long"))
@@ -0,0 +1,140 @@
+"""
+Order helpers shared by the order entry scripts
+"""
+
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; run the kernel as plain Python
+
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+
+        return decorator
+
+
+# Dynamic risk by (symbol, atr_period) as (risk, expires_at), so repeated
+# entries within one 15 minute bar reuse the ATR instead of refetching history
+RISK_CACHE_TTL = 15 * 60  # seconds, one bar of the ATR history
+_risk_cache = {}
+
+
+def bar_columns(bars):
+    """High, low and close of bars as float64 arrays"""
+    high = np.fromiter((bar.high for bar in bars), dtype=np.float64)
+    low = np.fromiter((bar.low for bar in bars), dtype=np.float64)
+    close = np.fromiter((bar.close for bar in bars), dtype=np.float64)
+    return high, low, close
+
+
+@njit(cache=True)
+def atr_kernel(high, low, close, period):
+    """Mean true range of the last period bars against each previous close"""
+    n = high.shape[0]
+    s = 0.0
+    for i in range(n - period, n):
+        hl = high[i] - low[i]
+        hc = abs(high[i] - close[i - 1])
+        lc = abs(low[i] - close[i - 1])
+        tr = hl if hl > hc else hc
+        s += tr if tr > lc else lc
+    return s / period
+
+
+def calculate_dynamic_risk(ib, stock, atr_period=14):
+    """Dynamic risk from the ATR, reusing a result younger than one bar"""
+    key = (stock.symbol, atr_period)
+    cached = _risk_cache.get(key)
+    now = time.monotonic()
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    risk = _fetch_dynamic_risk(ib, stock, atr_period)
+    _risk_cache[key] = (risk, now + RISK_CACHE_TTL)
+    return risk
+
+
+def _fetch_dynamic_risk(ib, stock, atr_period):
+    """Fetch 15 minute bars and take half their ATR as the risk, 0.5 without
+    enough history"""
+    bars = ib.reqHistoricalData(
+        stock,
+        endDateTime="",
+        durationStr="5 D",
+        barSizeSetting="15 mins",
+        whatToShow="TRADES",
+        useRTH=True,
+    )
+
+    if len(bars) > atr_period:
+        high, low, close = bar_columns(bars)
+        atr = atr_kernel(high, low, close, atr_period)
+        return round(atr * 0.5, 2)
+    else:
+        return 0.5
+
+
+def partition_shares(shares, weights=(3, 4, 3)):
+    """Split shares in proportion to integer weights, remainder to the last part"""
+    total_weight = sum(weights)
+    parts = [shares * weight // total_weight for weight in weights[:-1]]
+    parts.append(shares - sum(parts))
+    return parts
+
+
+async def wait_for_fill(trade, timeout=5.0):
+    """Wait until trade is filled, at most timeout seconds"""
+    if trade.orderStatus.status == "Filled":
+        return True
+
+    fill_event = asyncio.Event()
+
+    def on_filled(filled_trade):
+        fill_event.set()
+
+    trade.filledEvent += on_filled
+    try:
+        await asyncio.wait_for(fill_event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        logging.warning("Order %s not filled after %ss", trade.order.orderId, timeout)
+        return False
+    finally:
+        trade.filledEvent -= on_filled
+
+
+async def wait_for_cancel(trade, timeout=5.0):
+    """Wait until trade is cancelled (or otherwise done), at most timeout seconds"""
+    if trade.isDone():
+        return True
+
+    done_event = asyncio.Event()
+
+    def on_status(updated_trade):
+        # A stop can fill while its cancel is in flight, which ends it too
+        if updated_trade.isDone():
+            done_event.set()
+
+    trade.statusEvent += on_status
+    try:
+        await asyncio.wait_for(done_event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        logging.warning(
+            "Order %s not cancelled after %ss", trade.order.orderId, timeout
+        )
+        return False
+    finally:
+        trade.statusEvent -= on_status
+
+
+async def wait_for_entry_fill(trade, entry_price, timeout=2.0):
+    """Fill price of an entry trade, else the reference entry_price after timeout"""
+    await wait_for_fill(trade, timeout)
+    return trade.orderStatus.avgFillPrice or entry_price
@@ -0,0 +1,50 @@
+"""
+On-disk cache of historical bar DataFrames shared by the pre-market scanner
+and the levels plotter
+
+Entries are keyed by symbol, duration, bar size and today's date, so a
+same-day re-run reads parquet from disk instead of requesting the bars from
+TWS again, and the cache refreshes itself the next day
+
+Requirements:
+pip install pandas pyarrow
+"""
+
+import logging
+from datetime import date
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path.home() / '.ib_cache'
+
+
+def cache_path(symbol: str, duration: str, bar_size: str) -> Path:
+    """Path of the cache file for these bars today"""
+    name = f"{symbol}_{duration}_{bar_size}_{date.today():%Y%m%d}.parquet"
+    return CACHE_DIR / name.replace(' ', '')
+
+
+def load_bars(symbol: str, duration: str, bar_size: str) -> Optional[pd.DataFrame]:
+    """Return today's cached bars, or None on a miss"""
+    path = cache_path(symbol, duration, bar_size)
+    if not path.exists():
+        return None
+
+    try:
+        return pd.read_parquet(path)
+    except Exception as e:
+        logger.warning("Ignoring unreadable bar cache %s: %s", path, e)
+        return None
+
+
+def save_bars(symbol: str, duration: str, bar_size: str, df: pd.DataFrame):
+    """Store bars for the rest of the day; a failed write only costs a refetch"""
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(cache_path(symbol, duration, bar_size), index=False)
+    except Exception as e:
+        logger.warning("Could not cache bars for %s: %s", symbol, e)
@@ -16,6 +16,8 @@ import time
 
 from ib_insync import *
 
+from bar_cache import load_bars, save_bars
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -95,23 +97,27 @@ class LevelsPlotter:
 
     def get_historical_data(self, contract: Contract, duration: str = '30 D',
                             bar_size: str = '1 day') -> pd.DataFrame:
-        """Get historical data for calculations"""
+        """Get historical data for calculations, reusing today's cached copy"""
         try:
-            bars = self.ib.reqHistoricalData(
-                contract,
-                endDateTime='',
-                durationStr=duration,
-                barSizeSetting=bar_size,
-                whatToShow='TRADES',
-                useRTH=True,
-                formatDate=1
-            )
-
-            if not bars:
-                logger.error(f"No historical data received for {contract.symbol}")
-                return pd.DataFrame()
-
-            df = util.df(bars)
+            df = load_bars(contract.symbol, duration, bar_size)
+            if df is None:
+                bars = self.ib.reqHistoricalData(
+                    contract,
+                    endDateTime='',
+                    durationStr=duration,
+                    barSizeSetting=bar_size,
+                    whatToShow='TRADES',
+                    useRTH=True,
+                    formatDate=1
+                )
+
+                if not bars:
+                    logger.error(f"No historical data received for {contract.symbol}")
+                    return pd.DataFrame()
+
+                df = util.df(bars)
+                save_bars(contract.symbol, duration, bar_size, df)
+
             df['date'] = pd.to_datetime(df['date'])
             return df
 
@@ -137,18 +143,24 @@ class LevelsPlotter:
 
     def calculate_camarilla_pivots(self, high: float, low: float, close: float) -> Dict[str, float]:
         """Calculate Camarilla pivot points"""
+        # Each level sits a fraction of the 1.1x-scaled range from the close
         range_hl = high - low
+        scaled_range = range_hl * 1.1
+        r1 = scaled_range / 12
+        r2 = scaled_range / 6
+        r3 = scaled_range / 4
+        r4 = scaled_range / 2
 
         levels = {
             'PP': close,
-            'R1': close + range_hl * 1.1 / 12,
-            'R2': close + range_hl * 1.1 / 6,
-            'R3': close + range_hl * 1.1 / 4,
-            'R4': close + range_hl * 1.1 / 2,
-            'S1': close - range_hl * 1.1 / 12,
-            'S2': close - range_hl * 1.1 / 6,
-            'S3': close - range_hl * 1.1 / 4,
-            'S4': close - range_hl * 1.1 / 2
+            'R1': close + r1,
+            'R2': close + r2,
+            'R3': close + r3,
+            'R4': close + r4,
+            'S1': close - r1,
+            'S2': close - r2,
+            'S3': close - r3,
+            'S4': close - r4
         }
 
         return levels
@@ -173,24 +185,24 @@ class LevelsPlotter:
     def get_period_highs_lows(self, df: pd.DataFrame) -> Dict[str, float]:
         """Get key period highs and lows (horizontal levels only)"""
         levels = {}
+        # Slices of the raw arrays are views, so no per-period DataFrame copies
+        highs = df['high'].to_numpy()
+        lows = df['low'].to_numpy()
 
         if len(df) >= 5:
-            # Previous week high/low (5 trading days)
-            week_data = df.tail(6)[:-1]  # Exclude current day
-            levels['Week_High'] = week_data['high'].max()
-            levels['Week_Low'] = week_data['low'].min()
+            # Previous week high/low (5 trading days), excluding current day
+            levels['Week_High'] = highs[-6:-1].max()
+            levels['Week_Low'] = lows[-6:-1].min()
 
         if len(df) >= 20:
-            # Previous month high/low (20 trading days)
-            month_data = df.tail(21)[:-1]  # Exclude current day
-            levels['Month_High'] = month_data['high'].max()
-            levels['Month_Low'] = month_data['low'].min()
+            # Previous month high/low (20 trading days), excluding current day
+            levels['Month_High'] = highs[-21:-1].max()
+            levels['Month_Low'] = lows[-21:-1].min()
 
         if len(df) >= 50:
-            # 50-day high/low
-            data_50d = df.tail(51)[:-1]  # Exclude current day
-            levels['50D_High'] = data_50d['high'].max()
-            levels['50D_Low'] = data_50d['low'].min()
+            # 50-day high/low, excluding current day
+            levels['50D_High'] = highs[-51:-1].max()
+            levels['50D_Low'] = lows[-51:-1].min()
 
         return levels
 
@@ -4,7 +4,7 @@ Pre-Market Stock Scanner for Day Trading
 Identifies stocks with high volume and volatility potential
 
 Requirements:
-pip install ib_insync pandas numpy yfinance requests beautifulsoup4
+pip install ib_insync pandas numpy pyarrow yfinance requests beautifulsoup4 lxml
 """
 
 import asyncio
@@ -13,17 +13,27 @@ import numpy as np
 from datetime import datetime, timedelta
 import time
 import logging
-from typing import List, Dict, Tuple
+import re
+from typing import List, Dict, Tuple, Optional
 import yfinance as yf
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
 from ib_insync import *
 
+from bar_cache import load_bars, save_bars
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Ticker symbols scraped from stock page links: 1-5 letters
+SYMBOL_PATTERN = re.compile(r'[A-Z]{1,5}')
+
+# Metrics analyze_stock reports unrounded, rounded to cents after scoring
+ROUNDED_METRICS = ('current_price', 'prev_close', 'gap_percent', 'relative_volume',
+                   'atr', 'atr_percent', 'volatility')
+
 
 class PreMarketScanner:
     def __init__(self, host='127.0.0.1', port=7497, client_id=1):
@@ -48,6 +58,9 @@ class PreMarketScanner:
         self.min_relative_volume = 2.0  # 2x normal volume
         self.min_gap_percent = 2.0  # 2% gap minimum
 
+        # Request pacing
+        self.max_concurrent_requests = 8  # Symbols analyzed at once
+
     async def connect(self):
         """Connect to TWS/Gateway"""
         try:
@@ -97,13 +110,14 @@ class PreMarketScanner:
             response = requests.get(url, headers=headers, timeout=10)
 
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
+                # Only the links matter, so let the lxml parser build just those
+                soup = BeautifulSoup(response.content, 'lxml', parse_only=SoupStrainer('a', href=True))
                 # Parse ticker symbols from the page
                 for link in soup.find_all('a', href=True):
                     href = link.get('href', '')
                     if '/investing/stock/' in href:
-                        symbol = href.split('/')[-1].upper()
-                        if len(symbol) <= 5 and symbol.isalpha():
+                        symbol = href.rsplit('/', 1)[-1].upper()
+                        if SYMBOL_PATTERN.fullmatch(symbol):
                             symbols.add(symbol)
         except Exception as e:
             logger.warning(f"Error scraping pre-market movers: {e}")
@@ -131,65 +145,60 @@ class PreMarketScanner:
 
             contract = contract_details[0].contract
 
-            # Get current market data
+            # Get current market data, and the historical data for analysis
+            # while the ticker waits for its first second of data
             ticker = self.ib.reqMktData(contract, '', False, False)
-            await asyncio.sleep(1)  # Wait for data
-
-            # Get historical data for analysis
-            bars = await self.ib.reqHistoricalDataAsync(
-                contract,
-                endDateTime='',
-                durationStr='30 D',
-                barSizeSetting='1 day',
-                whatToShow='TRADES',
-                useRTH=True,
-                formatDate=1
-            )
+            df, _ = await asyncio.gather(self.get_daily_bars(contract), asyncio.sleep(1))
 
-            if len(bars) < 10:
+            if df is None or len(df) < 10:
                 return None
 
             # Calculate metrics
-            df = util.df(bars)
             current_price = ticker.marketPrice() or ticker.close
             prev_close = df.iloc[-2]['close'] if len(df) > 1 else df.iloc[-1]['close']
 
-            # Calculate average volume (20 days)
-            avg_volume = df['volume'].rolling(20).mean().iloc[-1]
+            # Calculate average volume (20 days), only the last window is needed
+            volume = df['volume'].to_numpy()
+            avg_volume = volume[-20:].mean() if len(volume) >= 20 else np.nan
             current_volume = ticker.volume or 0
             relative_volume = current_volume / avg_volume if avg_volume > 0 else 0
 
             # Calculate gap percentage
             gap_percent = ((current_price - prev_close) / prev_close) * 100 if prev_close > 0 else 0
 
-            # Calculate ATR (14 days)
-            df['high_low'] = df['high'] - df['low']
-            df['high_close'] = abs(df['high'] - df['close'].shift(1))
-            df['low_close'] = abs(df['low'] - df['close'].shift(1))
-            df['true_range'] = df[['high_low', 'high_close', 'low_close']].max(axis=1)
-            atr = df['true_range'].rolling(14).mean().iloc[-1]
-
-            # Calculate volatility score
-            price_changes = df['close'].pct_change().dropna()
-            volatility = price_changes.std() * 100
+            # Calculate ATR (14 days) on the raw arrays; the first bar has no
+            # previous close, so its true range is just high - low
+            high = df['high'].to_numpy()
+            low = df['low'].to_numpy()
+            close = df['close'].to_numpy()
+            prev_closes = np.empty_like(close)
+            prev_closes[0] = close[0]
+            prev_closes[1:] = close[:-1]
+            true_range = np.maximum(high - low, np.maximum(np.abs(high - prev_closes), np.abs(low - prev_closes)))
+            atr = true_range[-14:].mean() if len(true_range) >= 14 else np.nan
+
+            # Calculate volatility score from the daily returns of the close array
+            price_changes = close[1:] / close[:-1] - 1.0
+            volatility = price_changes.std(ddof=1) * 100
 
             # Volume profile analysis
             volume_profile = self.calculate_volume_profile(df)
 
+            # Unrounded, so the scoring bands see the exact metrics;
+            # scan_stocks rounds them to cents once they are scored
             analysis = {
                 'symbol': symbol,
-                'current_price': round(current_price, 2),
-                'prev_close': round(prev_close, 2),
-                'gap_percent': round(gap_percent, 2),
+                'current_price': current_price,
+                'prev_close': prev_close,
+                'gap_percent': gap_percent,
                 'current_volume': current_volume,
                 'avg_volume': int(avg_volume),
-                'relative_volume': round(relative_volume, 2),
-                'atr': round(atr, 2),
-                'atr_percent': round((atr / current_price) * 100, 2),
-                'volatility': round(volatility, 2),
+                'relative_volume': relative_volume,
+                'atr': atr,
+                'atr_percent': (atr / current_price) * 100,
+                'volatility': volatility,
                 'market_cap': self.estimate_market_cap(contract_details[0]),
-                'volume_profile': volume_profile,
-                'score': self.calculate_trading_score(gap_percent, relative_volume, volatility, atr, current_price)
+                'volume_profile': volume_profile
             }
 
             return analysis
@@ -198,23 +207,43 @@ class PreMarketScanner:
             logger.error(f"Error analyzing {symbol}: {e}")
             return None
 
+    async def get_daily_bars(self, contract: Contract) -> Optional[pd.DataFrame]:
+        """Get 30 days of daily bars, reusing today's cached copy"""
+        df = load_bars(contract.symbol, '30 D', '1 day')
+        if df is None:
+            bars = await self.ib.reqHistoricalDataAsync(
+                contract,
+                endDateTime='',
+                durationStr='30 D',
+                barSizeSetting='1 day',
+                whatToShow='TRADES',
+                useRTH=True,
+                formatDate=1
+            )
+            df = util.df(bars)
+            if df is not None:
+                save_bars(contract.symbol, '30 D', '1 day', df)
+
+        return df
+
     def calculate_volume_profile(self, df: pd.DataFrame) -> Dict:
         """Calculate volume profile for recent sessions"""
         if len(df) < 5:
             return {}
 
-        recent_df = df.tail(5)
+        close = df['close'].to_numpy()[-5:]
+        volume = df['volume'].to_numpy()[-5:]
 
         # Calculate VWAP levels
-        vwap = (recent_df['close'] * recent_df['volume']).sum() / recent_df['volume'].sum()
+        vwap = np.dot(close, volume) / volume.sum()
 
         # High volume areas
-        max_volume_day = recent_df.loc[recent_df['volume'].idxmax()]
+        max_volume_idx = int(volume.argmax())
 
         return {
             'vwap': round(vwap, 2),
-            'high_volume_price': round(max_volume_day['close'], 2),
-            'high_volume_level': int(max_volume_day['volume'])
+            'high_volume_price': round(close[max_volume_idx], 2),
+            'high_volume_level': int(volume[max_volume_idx])
         }
 
     def estimate_market_cap(self, contract_details) -> float:
@@ -223,47 +252,37 @@ class PreMarketScanner:
         # In practice, you'd want to get this from fundamental data
         return 1e9  # Default to 1B
 
-    def calculate_trading_score(self, gap_percent: float, relative_volume: float,
-                                volatility: float, atr: float, price: float) -> float:
-        """Calculate a trading score based on multiple factors"""
-        score = 0
+    def calculate_trading_score(self, gap_percent, relative_volume, volatility, atr, price):
+        """Calculate trading scores based on multiple factors
+
+        Takes scalars or whole result columns and scores them element-wise
+        """
+        gap_percent = np.abs(np.asarray(gap_percent))
+        relative_volume = np.asarray(relative_volume)
+        volatility = np.asarray(volatility)
+        price = np.asarray(price)
+        atr_percent = (np.asarray(atr) / price) * 100
 
         # Gap score (higher gaps = higher score)
-        if abs(gap_percent) > 5:
-            score += 30
-        elif abs(gap_percent) > 3:
-            score += 20
-        elif abs(gap_percent) > 1:
-            score += 10
+        score = np.select([gap_percent > 5, gap_percent > 3, gap_percent > 1], [30, 20, 10], 0)
 
         # Relative volume score
-        if relative_volume > 3:
-            score += 25
-        elif relative_volume > 2:
-            score += 15
-        elif relative_volume > 1.5:
-            score += 10
+        score += np.select([relative_volume > 3, relative_volume > 2, relative_volume > 1.5], [25, 15, 10], 0)
 
         # Volatility score
-        if volatility > 5:
-            score += 20
-        elif volatility > 3:
-            score += 15
-        elif volatility > 2:
-            score += 10
+        score += np.select([volatility > 5, volatility > 3, volatility > 2], [20, 15, 10], 0)
 
         # ATR score (prefer reasonable ATR)
-        atr_percent = (atr / price) * 100
-        if 2 <= atr_percent <= 8:
-            score += 15
-        elif 1 <= atr_percent < 2 or 8 < atr_percent <= 12:
-            score += 10
+        score += np.select([
+            (2 <= atr_percent) & (atr_percent <= 8),
+            ((1 <= atr_percent) & (atr_percent < 2)) | ((8 < atr_percent) & (atr_percent <= 12))
+        ], [15, 10], 0)
 
         # Price range preference
-        if 10 <= price <= 200:
-            score += 10
-        elif 5 <= price < 10 or 200 < price <= 300:
-            score += 5
+        score += np.select([
+            (10 <= price) & (price <= 200),
+            ((5 <= price) & (price < 10)) | ((200 < price) & (price <= 300))
+        ], [10, 5], 0)
 
         return score
 
@@ -274,27 +293,42 @@ class PreMarketScanner:
 
         logger.info(f"Scanning {len(symbols)} stocks...")
 
+        # Each analysis mostly waits on TWS, so overlap them, with the
+        # semaphore capping how many are in flight (rate limiting)
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+
+        async def analyze(symbol):
+            async with semaphore:
+                return await self.analyze_stock(symbol)
+
+        analyses = await asyncio.gather(*(analyze(symbol) for symbol in symbols), return_exceptions=True)
+
         results = []
-        for i, symbol in enumerate(symbols):
-            try:
-                analysis = await self.analyze_stock(symbol)
-                if analysis and analysis['score'] > 20:  # Minimum score threshold
-                    results.append(analysis)
-                    logger.info(f"Analyzed {symbol} - Score: {analysis['score']}")
-
-                # Rate limiting
-                if i % 10 == 0:
-                    await asyncio.sleep(1)
-
-            except Exception as e:
-                logger.error(f"Error scanning {symbol}: {e}")
+        for symbol, analysis in zip(symbols, analyses):
+            if isinstance(analysis, Exception):
+                logger.error(f"Error scanning {symbol}: {analysis}")
                 continue
+            if analysis:
+                results.append(analysis)
 
         if not results:
             return pd.DataFrame()
 
-        # Convert to DataFrame and sort by score
+        # Score every analyzed stock in one pass over the columns
         df = pd.DataFrame(results)
+        df['score'] = self.calculate_trading_score(
+            df['gap_percent'].to_numpy(), df['relative_volume'].to_numpy(),
+            df['volatility'].to_numpy(), df['atr'].to_numpy(), df['current_price'].to_numpy()
+        )
+        df = df.round(dict.fromkeys(ROUNDED_METRICS, 2))
+        df = df[df['score'] > 20]  # Minimum score threshold
+        for symbol, score in zip(df['symbol'], df['score']):
+            logger.info(f"Analyzed {symbol} - Score: {score}")
+
+        if df.empty:
+            return pd.DataFrame()
+
+        # Sort by score
         df = df.sort_values('score', ascending=False)
 
         # Filter by criteria
@@ -0,0 +1,13 @@
+"""
+The order entry scripts and the scanner are run as plain scripts from their
+own directories, so put those directories on the import path for the tests
+"""
+
+import sys
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent
+
+for path in (API_DIR, API_DIR / "premarket_scanner"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
@@ -0,0 +1,11 @@
+"""
+The levels script imports without connecting or failing
+"""
+
+import pytest
+
+
+def test_import_has_no_side_effects():
+    levels = pytest.importorskip("order_entry_levels")
+
+    assert not levels.ib.isConnected()
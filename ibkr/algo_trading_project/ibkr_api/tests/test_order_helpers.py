@@ -0,0 +1,27 @@
+"""
+Fill and cancel waits shared by the order entry scripts
+"""
+
+import asyncio
+
+import pytest
+
+helpers = pytest.importorskip("order_helpers")
+ib_insync = pytest.importorskip("ib_insync")
+
+
+@pytest.mark.parametrize("status", ["Cancelled", "Filled"])
+def test_wait_for_cancel_returns_once_the_order_is_done(status):
+    trade = ib_insync.Trade(
+        ib_insync.Stock("AMD", "SMART", "USD"), ib_insync.StopOrder("SELL", 1, 99.0)
+    )
+    trade.orderStatus.status = "Submitted"
+
+    async def run():
+        wait = asyncio.ensure_future(helpers.wait_for_cancel(trade, timeout=1))
+        await asyncio.sleep(0)
+        trade.orderStatus.status = status
+        trade.statusEvent.emit(trade)
+        return await wait
+
+    assert asyncio.run(run()) is True
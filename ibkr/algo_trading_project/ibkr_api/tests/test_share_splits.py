@@ -0,0 +1,139 @@
+"""
+Share splits used to size the partial exits
+"""
+
+import asyncio
+
+import pytest
+
+TOTALS = [1, 2, 3, 10]
+
+
+class RecordingIB:
+    """Stands in for the scripts' IB client and records the orders sent"""
+
+    def __init__(self):
+        ib_insync = pytest.importorskip("ib_insync")
+        self._trade = ib_insync.Trade
+        self.orders = []
+        self.positionEvent = ib_insync.Event("positionEvent")
+
+    def placeOrder(self, contract, order):
+        self.orders.append(order)
+        return self._trade(contract, order)
+
+    def cancelOrder(self, order):
+        return None
+
+
+@pytest.mark.parametrize("shares", TOTALS)
+def test_partition_shares_adds_up(shares):
+    helpers = pytest.importorskip("order_helpers")
+    parts = helpers.partition_shares(shares)
+
+    assert len(parts) == 3
+    assert sum(parts) == shares
+    assert all(part >= 0 for part in parts)
+    assert parts[-1] > 0
+
+
+@pytest.mark.parametrize("shares", TOTALS)
+def test_split_shares_adds_up(shares):
+    improved = pytest.importorskip("order_entry_partials_improved")
+    parts = improved.split_shares(shares, 3)
+
+    assert len(parts) == 3
+    assert sum(parts) == shares
+    assert all(part >= 0 for part in parts)
+    assert max(parts) - min(parts) <= 1
+    assert parts[-1] > 0
+
+
+@pytest.mark.parametrize("shares", TOTALS)
+def test_manage_partials_sends_no_empty_targets(shares, monkeypatch):
+    risk = pytest.importorskip("order_entry_partials_risk")
+    ib_insync = pytest.importorskip("ib_insync")
+    fake_ib = RecordingIB()
+    monkeypatch.setattr(risk, "ib", fake_ib)
+    stock = ib_insync.Stock("AMD", "SMART", "USD", conId=1)
+    stop_order = ib_insync.StopOrder("SELL", shares, 99.0)
+
+    async def run():
+        task = asyncio.ensure_future(
+            risk.manage_partials(
+                stock, "long", 100.0, 1.0, shares, stop_order, ib_insync.Ticker()
+            )
+        )
+        await asyncio.sleep(0)
+        fake_ib.positionEvent.emit(ib_insync.Position("DU1", stock, 0.0, 0.0))
+        await asyncio.wait_for(task, 1)
+
+    asyncio.run(run())
+
+    assert sum(order.totalQuantity for order in fake_ib.orders) == shares
+    assert all(order.totalQuantity > 0 for order in fake_ib.orders)
+
+
+@pytest.mark.parametrize("shares", TOTALS)
+def test_take_partial_sends_no_empty_orders(shares, monkeypatch):
+    improved = pytest.importorskip("order_entry_partials_improved")
+    ib_insync = pytest.importorskip("ib_insync")
+    fake_ib = RecordingIB()
+    monkeypatch.setattr(improved, "ib", fake_ib)
+    state = improved.TradeState(
+        stock=ib_insync.Stock("AMD", "SMART", "USD", conId=1),
+        entry_price=100.0,
+        risk_amount=1.0,
+        sign=1,
+        partial1_target=101.5,
+        partial2_target=103.0,
+        partial3_target=105.0,
+        partial1_ticks=10150,
+        partial2_ticks=10300,
+        partial3_ticks=10500,
+        stop_ticks=9900,
+        partial_sizes=improved.split_shares(shares, 3),
+        remaining_shares=shares,
+        current_stop_price=99.0,
+        market_exit=ib_insync.Order(action="SELL", orderType="MKT"),
+        target_hit=None,
+        stop_loss_order=ib_insync.StopOrder("SELL", shares, 99.0),
+    )
+
+    state.take_partial(100.0)
+    state.take_partial(101.0)
+
+    assert state.remaining_shares > 0
+    assert all(order.totalQuantity > 0 for order in fake_ib.orders)
+
+
+@pytest.mark.parametrize("shares", TOTALS)
+def test_levels_take_partial_sends_no_empty_orders(shares, monkeypatch):
+    levels = pytest.importorskip("order_entry_levels")
+    ib_insync = pytest.importorskip("ib_insync")
+    fake_ib = RecordingIB()
+    monkeypatch.setattr(levels, "ib", fake_ib)
+    stock = ib_insync.Stock("AMD", "SMART", "USD", conId=1)
+    state = levels.TradeState(
+        stock=stock,
+        direction="long",
+        entry_price=100.0,
+        risk_amount=1.0,
+        partial1_target=101.5,
+        partial2_target=103.0,
+        partial3_target=105.0,
+        partial_sizes=levels.partition_shares(shares, (1, 1, 1)),
+        remaining_shares=shares,
+        current_stop_price=99.0,
+        exit_action="SELL",
+        target_hit=None,
+    )
+    state.track_stop(
+        ib_insync.Trade(stock, ib_insync.StopOrder("SELL", shares, 99.0))
+    )
+
+    state.take_partial(100.0)
+    state.take_partial(101.0)
+
+    assert state.remaining_shares > 0
+    assert all(order.totalQuantity > 0 for order in fake_ib.orders)
@@ -0,0 +1,49 @@
+"""
+Trade status box borders line up for every layout
+"""
+
+import pytest
+
+improved = pytest.importorskip("order_entry_partials_improved")
+
+FIELDS = dict(
+    symbol="AMD",
+    direction="LONG",
+    shares=100,
+    stage="Initial",
+    entry=100.0,
+    current=101.25,
+    pnl_sign="+",
+    points_pnl=1.25,
+    pct_pnl=1.25,
+    dollar_pnl=125.0,
+    stop=98.0,
+    target1=103.0,
+    target2=106.0,
+    target3=110.0,
+    **{f"{name}_pct": "1.98%" for name in ("tp1", "tp2", "tp3", "sl")},
+    **{f"{name}_ticks": "200 ticks" for name in ("tp1", "tp2", "tp3", "sl")},
+)
+
+
+@pytest.mark.parametrize("key", list(improved._STATUS_LAYOUTS))
+@pytest.mark.parametrize(
+    "fields",
+    [FIELDS, dict(FIELDS, sl_ticks="123456789 ticks", symbol="TOOLONGSYM")],
+    ids=["typical", "overflow"],
+)
+def test_box_lines_have_one_width(key, fields):
+    box = improved._render_status_box(improved._STATUS_LAYOUTS[key], fields)
+    lines = box.splitlines()[1:]  # The box starts on a fresh line
+
+    assert len({len(line) for line in lines}) == 1
+    assert all(line[-1] in "╗╣║╝" for line in lines)
+
+
+def test_display_trade_status_logs_the_given_symbol(caplog):
+    with caplog.at_level("INFO"):
+        improved.display_trade_status(
+            "AMD", 101.25, 100.0, 98.0, 103.0, 106.0, "long", 100, "Initial", 110.0
+        )
+
+    assert "Symbol: AMD" in caplog.text
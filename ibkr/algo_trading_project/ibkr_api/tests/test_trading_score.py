@@ -0,0 +1,116 @@
+"""
+Column-wise scanner score against the per-stock score it replaced
+"""
+
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+scanner_module = pytest.importorskip("premarket_scanner")
+
+# (gap_percent, relative_volume, volatility, atr, price), hitting each band
+# and the edges between bands
+ROWS = [
+    (0.0, 0.0, 0.0, 0.0, 1.0),
+    (0.5, 1.0, 1.0, 0.5, 4.99),
+    (1.0, 1.5, 2.0, 1.0, 100.0),
+    (1.01, 1.51, 2.01, 2.0, 100.0),
+    (-3.0, 2.0, 3.0, 8.0, 100.0),
+    (3.5, 2.5, 3.5, 8.5, 100.0),
+    (-5.0, 3.0, 5.0, 12.0, 100.0),
+    (5.01, 3.01, 5.01, 12.5, 100.0),
+    (-12.0, 10.0, 9.0, 0.5, 5.0),
+    (2.0, 1.7, 2.5, 1.0, 10.0),
+    (4.0, 2.2, 4.0, 20.0, 200.0),
+    (6.0, 4.0, 6.0, 6.0, 300.0),
+    (7.0, 5.0, 7.0, 12.0, 300.01),
+    (-0.9, 0.3, 0.4, 50.0, 450.0),
+]
+
+
+def reference_score(gap_percent, relative_volume, volatility, atr, price):
+    """The scanner's original per-stock scoring"""
+    score = 0
+
+    if abs(gap_percent) > 5:
+        score += 30
+    elif abs(gap_percent) > 3:
+        score += 20
+    elif abs(gap_percent) > 1:
+        score += 10
+
+    if relative_volume > 3:
+        score += 25
+    elif relative_volume > 2:
+        score += 15
+    elif relative_volume > 1.5:
+        score += 10
+
+    if volatility > 5:
+        score += 20
+    elif volatility > 3:
+        score += 15
+    elif volatility > 2:
+        score += 10
+
+    atr_percent = (atr / price) * 100
+    if 2 <= atr_percent <= 8:
+        score += 15
+    elif 1 <= atr_percent < 2 or 8 < atr_percent <= 12:
+        score += 10
+
+    if 10 <= price <= 200:
+        score += 10
+    elif 5 <= price < 10 or 200 < price <= 300:
+        score += 5
+
+    return score
+
+
+@pytest.fixture
+def scanner():
+    return scanner_module.PreMarketScanner()
+
+
+def test_column_scores_match_reference(scanner):
+    columns = [np.array(column, dtype=np.float64) for column in zip(*ROWS)]
+    scores = scanner.calculate_trading_score(*columns)
+
+    assert scores.tolist() == [reference_score(*row) for row in ROWS]
+
+
+@pytest.mark.parametrize("row", ROWS)
+def test_scalar_score_matches_reference(scanner, row):
+    assert int(scanner.calculate_trading_score(*row)) == reference_score(*row)
+
+
+def test_scan_scores_unrounded_metrics(scanner, monkeypatch):
+    # Just past the 5% gap band, and an ATR of 2.02% of price that rounds
+    # down to 0.10 (1.92%) at cents
+    analysis = dict(
+        symbol="ABC",
+        current_price=5.2,
+        prev_close=4.95,
+        gap_percent=5.004,
+        current_volume=5e6,
+        avg_volume=2_000_000,
+        relative_volume=2.5,
+        atr=0.1049,
+        atr_percent=0.1049 / 5.2 * 100,
+        volatility=2.5,
+        market_cap=1e9,
+        volume_profile={},
+    )
+
+    async def analyze_stock(symbol):
+        return dict(analysis)
+
+    monkeypatch.setattr(scanner, "analyze_stock", analyze_stock)
+    df = asyncio.run(scanner.scan_stocks(["ABC"]))
+
+    row = df.iloc[0]
+    assert row["score"] == reference_score(5.004, 2.5, 2.5, 0.1049, 5.2)
+    assert row["score"] == 30 + 15 + 10 + 15 + 5
+    assert row["gap_percent"] == 5.0
+    assert row["atr"] == 0.1
@@ -1,15 +1,27 @@
 import asyncio
+import dataclasses
 import json
 import math
 import logging
 import nest_asyncio
+import os
 import time
 import sys
+from dataclasses import dataclass
 import numpy as np
-import pandas as pd
 from aiohttp import web
 from ib_insync import *
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; run the kernels as plain Python
+
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+
+        return decorator
+
 # Apply nest_asyncio to allow nested event loops
 nest_asyncio.apply()
 
@@ -25,6 +37,30 @@ connected_clients = set()
 MAX_RETRY_ATTEMPTS = 3
 RETRY_DELAY = 5  # seconds
 
+# Historical bars are cached on disk for one bar length to spare IB pacing limits
+BAR_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "bars")
+
+# Strong references to fire-and-forget tasks so they are not garbage collected
+# while still running; each task drops itself from the set when done
+_background_tasks = set()
+
+
+def _log_task_exception(task):
+    """Log the exception of a background task that failed"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(
+            "Background task %s failed", task.get_name(), exc_info=task.exception()
+        )
+
+
+def spawn_background_task(coro):
+    """Run coro as a task kept alive until it finishes"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    task.add_done_callback(_log_task_exception)
+    return task
+
 
 async def connect_ib_with_retry():
     """Connect to Interactive Brokers with retry logic"""
@@ -102,14 +138,141 @@ async def connect_ib_with_retry():
 
 
 # 3R Trading Strategy Functions
-async def calculate_volatility_based_risk(symbol, timeframe=5, lookback=20):
+@njit(cache=True)
+def _true_range(high, low, close):
+    """True range of every bar; the first bar uses its high - low"""
+    n = high.shape[0]
+    tr = np.empty(n)
+    tr[0] = high[0] - low[0]
+    for i in range(1, n):
+        hl = high[i] - low[i]
+        hc = abs(high[i] - close[i - 1])
+        lc = abs(low[i] - close[i - 1])
+        tr[i] = max(hl, hc, lc)
+    return tr
+
+
+@njit(cache=True)
+def _wilder_rma(tr, n):
+    """Wilder's moving average (RMA) of tr, seeded with the mean of the first n values"""
+    out = np.empty_like(tr)
+    out[: n - 1] = np.nan
+    s = tr[:n].sum() / n
+    out[n - 1] = s
+    for i in range(n, tr.size):
+        s = s + (tr[i] - s) / n
+        out[i] = s
+    return out
+
+
+@dataclass
+class BarColumns:
+    """Historical bars stored column-wise as parallel float64 arrays"""
+
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+
+    @classmethod
+    def from_bars(cls, bars):
+        """Fill the columns in a single pass over ib_insync BarData objects"""
+        n = len(bars)
+        high, low, close = np.empty(n), np.empty(n), np.empty(n)
+        for i, bar in enumerate(bars):
+            high[i], low[i], close[i] = bar.high, bar.low, bar.close
+        return cls(high, low, close)
+
+    def __len__(self):
+        return self.high.shape[0]
+
+
+def _bar_cache_path(symbol, timeframe, lookback):
+    return os.path.join(BAR_CACHE_DIR, f"{symbol}_{timeframe}min_{lookback}.npz")
+
+
+def _load_cached_bars(symbol, timeframe, lookback):
     """
-    Calculate risk (R) based on recent volatility.
+    Return cached BarColumns if they are younger than one bar, else None.
+    """
+    path = _bar_cache_path(symbol, timeframe, lookback)
+    try:
+        if time.time() - os.path.getmtime(path) > timeframe * 60:
+            return None
+        with np.load(path) as cached:
+            return BarColumns(cached["high"], cached["low"], cached["close"])
+    except OSError:
+        return None
+    except Exception as e:
+        logger.warning("Ignoring unreadable bar cache %s: %s", path, e)
+        return None
+
+
+def _save_cached_bars(symbol, timeframe, lookback, columns):
+    """
+    Write BarColumns to the bar cache.
+    """
+    path = _bar_cache_path(symbol, timeframe, lookback)
+    try:
+        os.makedirs(BAR_CACHE_DIR, exist_ok=True)
+        np.savez(path, high=columns.high, low=columns.low, close=columns.close)
+    except Exception as e:
+        logger.warning("Could not cache bars for %s: %s", symbol, e)
+
+
+def _risk_from_columns(symbol, columns, timeframe, lookback, smoothing="sma"):
+    """
+    Turn one symbol's bar columns into R, or the default on too little data.
+    smoothing="wilder" uses Wilder's RMA of the true range instead of its mean.
+    """
+    if len(columns) < lookback / 2:  # At least half the requested bars
+        logger.warning(
+            "Insufficient historical data returned for %s (%s bars). Using default risk value.",
+            symbol,
+            len(columns),
+        )
+        return 0.5  # Default risk value
+
+    # Calculate volatility using Average True Range (ATR)
+    tr = _true_range(columns.high, columns.low, columns.close)
+    if smoothing == "wilder":
+        atr = _wilder_rma(tr, min(lookback, tr.size))[-1]
+    else:
+        atr = tr.mean()
+
+    # Calculate risk as a percentage of ATR (adjust this factor based on your risk tolerance)
+    risk_factor = 0.5  # More conservative: 0.3, More aggressive: 0.7
+    R = round(atr * risk_factor, 2)
+
+    logger.info(
+        "Calculated risk (R) for %s based on %s-min volatility: $%s",
+        symbol,
+        timeframe,
+        R,
+    )
+    return R
+
+
+async def calculate_volatility_based_risks(
+    symbols, timeframe=5, lookback=20, smoothing="sma"
+):
+    """
+    Calculate risk (R) for several symbols, requesting their history concurrently.
     """
     logger.info(
-        f"Calculating volatility-based risk for {symbol} on {timeframe}-min chart..."
+        "Calculating volatility-based risk for %s on %s-min chart...",
+        ", ".join(symbols),
+        timeframe,
     )
 
+    # Serve what we can from the bar cache and only ask IB for the rest
+    columns_by_symbol = {}
+    for symbol in symbols:
+        cached = _load_cached_bars(symbol, timeframe, lookback)
+        if cached is not None:
+            logger.info("Using cached %s-min bars for %s", timeframe, symbol)
+            columns_by_symbol[symbol] = cached
+    missing = [symbol for symbol in symbols if symbol not in columns_by_symbol]
+
     # Convert lookback periods to seconds for proper duration format
     seconds_needed = lookback * timeframe * 60
 
@@ -118,14 +281,15 @@ async def calculate_volatility_based_risk(symbol, timeframe=5, lookback=20):
 
     # For longer periods, convert to days to avoid potential issues
     if seconds_needed > 86400:  # More than 1 day in seconds
-        days_needed = math.ceil(seconds_needed / 86400)
+        days_needed = (seconds_needed + 86399) // 86400
         duration = f"{days_needed} D"
 
-    logger.info(f"Requesting historical data with duration: {duration}")
+    if missing:
+        logger.info("Requesting historical data with duration: %s", duration)
 
-    # Request historical data
-    try:
-        bars = ib.reqHistoricalData(
+    # Send every request up front so the round-trips to TWS overlap
+    requests = [
+        ib.reqHistoricalDataAsync(
             Stock(symbol, "SMART", "USD"),
             endDateTime="",  # Current time
             durationStr=duration,
@@ -133,33 +297,46 @@ async def calculate_volatility_based_risk(symbol, timeframe=5, lookback=20):
             whatToShow="TRADES",
             useRTH=True,
         )
+        for symbol in missing
+    ]
+    results = await asyncio.gather(*requests, return_exceptions=True)
 
-        if not bars or len(bars) < lookback / 2:  # At least half the requested bars
-            logger.warning(
-                f"Insufficient historical data returned ({len(bars) if bars else 0} bars). Using default risk value."
+    risks = {}
+    for symbol, bars in zip(missing, results):
+        if isinstance(bars, Exception):
+            logger.error(
+                "Error calculating volatility-based risk for %s: %s", symbol, bars
             )
-            return 0.5  # Default risk value
-
-        # Convert to pandas DataFrame
-        df = pd.DataFrame(bars)
+            risks[symbol] = 0.5  # Default risk value on error
+            continue
+        columns_by_symbol[symbol] = BarColumns.from_bars(bars or [])
+        if bars:
+            _save_cached_bars(symbol, timeframe, lookback, columns_by_symbol[symbol])
 
-        # Calculate volatility using Average True Range (ATR)
-        df["high_low"] = df["high"] - df["low"]
-        df["high_close"] = abs(df["high"] - df["close"].shift(1))
-        df["low_close"] = abs(df["low"] - df["close"].shift(1))
-        df["tr"] = df[["high_low", "high_close", "low_close"]].max(axis=1)
-        atr = df["tr"].mean()
+    for symbol, columns in columns_by_symbol.items():
+        try:
+            risks[symbol] = _risk_from_columns(
+                symbol, columns, timeframe, lookback, smoothing
+            )
+        except Exception as e:
+            logger.error(
+                "Error calculating volatility-based risk for %s: %s", symbol, e
+            )
+            risks[symbol] = 0.5  # Default risk value on error
 
-        # Calculate risk as a percentage of ATR (adjust this factor based on your risk tolerance)
-        risk_factor = 0.5  # More conservative: 0.3, More aggressive: 0.7
-        R = round(atr * risk_factor, 2)
+    return risks
 
-        logger.info(f"Calculated risk (R) based on {timeframe}-min volatility: ${R}")
-        return R
 
-    except Exception as e:
-        logger.error(f"Error calculating volatility-based risk: {e}")
-        return 0.5  # Default risk value on error
+async def calculate_volatility_based_risk(
+    symbol, timeframe=5, lookback=20, smoothing="sma"
+):
+    """
+    Calculate risk (R) based on recent volatility.
+    """
+    risks = await calculate_volatility_based_risks(
+        [symbol], timeframe, lookback, smoothing
+    )
+    return risks[symbol]
 
 
 async def create_trailing_stop_order(action, quantity, trail_amount):
@@ -175,17 +352,23 @@ async def create_trailing_stop_order(action, quantity, trail_amount):
     return trailing_stop_order
 
 
-async def enter_3r_trade(ws, symbol, direction, share_size, timeframe, lookback):
+async def enter_3r_trade(
+    ws, symbol, direction, share_size, timeframe, lookback, smoothing="sma"
+):
     """
-    Implements the 3R trading strategy
+    Implements the 3R trading strategy, from entry through trade management
     """
-    try:
-        # Define stock contract
-        stock = Stock(symbol, "SMART", "USD")
+    # Define stock contract
+    stock = Stock(symbol, "SMART", "USD")
+
+    # Open the one market data subscription for the whole trade before the
+    # entry goes out, so the ticker is already streaming once the order fills
+    ticker = ib.reqMktData(stock, "", False, False)
 
+    try:
         # Calculate risk based on volatility
         R = await calculate_volatility_based_risk(
-            symbol, timeframe=timeframe, lookback=lookback
+            symbol, timeframe=timeframe, lookback=lookback, smoothing=smoothing
         )
 
         # Send initial confirmation and R value
@@ -198,8 +381,13 @@ async def enter_3r_trade(ws, symbol, direction, share_size, timeframe, lookback)
             }
         )
 
+        # Direction never changes during the trade, so resolve it once
+        if direction == "long":
+            sign, initial_action, stop_action = 1, "BUY", "SELL"
+        else:
+            sign, initial_action, stop_action = -1, "SELL", "BUY"
+
         # Place initial market order for share_size shares
-        initial_action = "BUY" if direction == "long" else "SELL"
         initial_order = MarketOrder(initial_action, share_size)
 
         await ws.send_json(
@@ -211,18 +399,22 @@ async def enter_3r_trade(ws, symbol, direction, share_size, timeframe, lookback)
         )
 
         trade = ib.placeOrder(stock, initial_order)
-        await asyncio.sleep(2)  # Wait for the order to fill
 
-        # Check if order is filled
-        filled = False
-        timeout = 10  # seconds
-        start_time = time.time()
-        while not filled and (time.time() - start_time) < timeout:
-            ib.waitOnUpdate(timeout=0.2)
-            if trade.orderStatus.status == "Filled":
-                filled = True
-                break
-            await asyncio.sleep(0.5)
+        # Wait for the fill event so the stop goes out as soon as TWS reports it
+        fill_event = asyncio.Event()
+
+        def on_filled(filled_trade):
+            fill_event.set()
+
+        trade.filledEvent += on_filled
+        try:
+            timeout = 10  # seconds
+            await asyncio.wait_for(fill_event.wait(), timeout)
+            filled = True
+        except asyncio.TimeoutError:
+            filled = trade.orderStatus.status == "Filled"
+        finally:
+            trade.filledEvent -= on_filled
 
         if not filled:
             await ws.send_json(
@@ -236,10 +428,8 @@ async def enter_3r_trade(ws, symbol, direction, share_size, timeframe, lookback)
         # Capture fill price for reference
         entry_price = trade.orderStatus.avgFillPrice
         if not entry_price or math.isnan(entry_price):
-            # Get current market price as fallback
-            market_data = ib.reqMktData(stock)
-            await asyncio.sleep(1)
-            entry_price = market_data.last
+            # Fall back to the last trade price from the open subscription
+            entry_price = ticker.last
 
         await ws.send_json(
             {
@@ -251,8 +441,7 @@ async def enter_3r_trade(ws, symbol, direction, share_size, timeframe, lookback)
         )
 
         # Set initial stop loss
-        stop_price = entry_price - R if direction == "long" else entry_price + R
-        stop_action = "SELL" if direction == "long" else "BUY"
+        stop_price = entry_price - sign * R
         stop_loss_order = StopOrder(stop_action, share_size, stop_price)
         ib.placeOrder(stock, stop_loss_order)
 
@@ -266,10 +455,8 @@ async def enter_3r_trade(ws, symbol, direction, share_size, timeframe, lookback)
         )
 
         # Calculate profit targets
-        partial1_target = entry_price + R if direction == "long" else entry_price - R
-        partial2_target = (
-            entry_price + 2 * R if direction == "long" else entry_price - 2 * R
-        )
+        partial1_target = entry_price + sign * R
+        partial2_target = entry_price + sign * 2 * R
 
         await ws.send_json(
             {
@@ -281,30 +468,31 @@ async def enter_3r_trade(ws, symbol, direction, share_size, timeframe, lookback)
             }
         )
 
-        # Start trade management in a background task
-        asyncio.create_task(
-            manage_3r_trade(
-                ws,
-                entry_price,
-                trade,
-                stop_loss_order,
-                direction,
-                share_size,
-                R,
-                stock,
-                partial1_target,
-                partial2_target,
-            )
+        # Manage the trade on the same ticker until it is closed or timed out
+        await manage_3r_trade(
+            ws,
+            entry_price,
+            trade,
+            stop_loss_order,
+            direction,
+            share_size,
+            R,
+            stock,
+            ticker,
+            partial1_target,
+            partial2_target,
         )
 
         return True
 
     except Exception as e:
-        logger.error(f"Error executing 3R trade: {e}")
+        logger.error("Error executing 3R trade: %s", e)
         await ws.send_json(
             {"type": "error", "message": f"Failed to execute 3R trade: {e}"}
         )
         return False
+    finally:
+        ib.cancelMktData(stock)
 
 
 async def manage_3r_trade(
@@ -316,11 +504,13 @@ async def manage_3r_trade(
     share_size,
     R,
     stock,
+    ticker,
     partial1_target,
     partial2_target,
 ):
     """
-    Manages the 3R trade with partial profit taking
+    Manages the 3R trade with partial profit taking, on the ticker opened by
+    enter_3r_trade
     """
     try:
         logger.info("Managing 3R trade...")
@@ -333,53 +523,84 @@ async def manage_3r_trade(
         )
 
         remaining_shares = share_size
-        first_partial = False
-        second_partial = False
+        stage = 0  # 0 = initial, 1 = after first partial, 2 = after second partial
         break_even_stop = None
-        partial_size = math.ceil(share_size / 3)
+        partial_size = (share_size + 2) // 3  # Round up without float division
+
+        # Direction never changes during the trade, so resolve it once
+        if direction == "long":
+            sign, exit_action = 1, "SELL"
+        else:
+            sign, exit_action = -1, "BUY"
+
+        # Exit order templates; each exit only fills in its size and price
+        market_exit = Order(action=exit_action, orderType="MKT")
+        stop_exit = Order(action=exit_action, orderType="STP")
+        trailing_exit = Order(action=exit_action, orderType="TRAIL")
+
+        # Profit targets in direction-normalised price, ascending. The number of
+        # thresholds at or below sign * price is how many partials are due.
+        targets = np.array([sign * partial1_target, sign * partial2_target])
 
         # Monitor the trade for a set period or until closed
         max_monitoring_time = 60 * 60  # 1 hour maximum
         start_monitoring_time = time.time()
+        last_price_update = 0
 
-        while (
-            remaining_shares > 0
-            and (time.time() - start_monitoring_time) < max_monitoring_time
-        ):
-            # Check if we still have a position
-            try:
-                portfolio = ib.portfolio()
-                position_size = 0
-
-                for item in portfolio:
-                    if item.contract.symbol == stock.symbol:
-                        position_size = item.position
-                        if (direction == "long" and position_size <= 0) or (
-                            direction == "short" and position_size >= 0
-                        ):
-                            await ws.send_json(
-                                {
-                                    "type": "3r_trade_update",
-                                    "status": "Closed",
-                                    "message": f"Position closed. Final size: {position_size}",
-                                }
-                            )
-                            return  # Exit the function if the position is closed
-                        break
-            except Exception as e:
-                logger.error(f"Error checking portfolio: {e}")
+        # The ticker wakes the loop whenever a new tick arrives
+        tick_event = asyncio.Event()
 
-            # Get latest price
-            try:
-                market_data = ib.reqMktData(stock)
-                await asyncio.sleep(1)  # Short delay for price polling
-                current_price = market_data.last
+        def on_tick(updated_ticker):
+            tick_event.set()
+
+        ticker.updateEvent += on_tick
+
+        # Keep a symbol -> portfolio item map that TWS updates as positions change
+        symbol = stock.symbol
+        portfolio_by_symbol = {item.contract.symbol: item for item in ib.portfolio()}
 
-                if current_price and not math.isnan(current_price):
-                    logger.info(f"Current price: {current_price}")
+        def on_portfolio(item):
+            portfolio_by_symbol[item.contract.symbol] = item
 
-                    # Send price update periodically (not every loop to avoid flooding)
-                    if int(time.time()) % 10 == 0:  # Every 10 seconds
+        ib.updatePortfolioEvent += on_portfolio
+
+        try:
+            while (
+                remaining_shares > 0
+                and (time.time() - start_monitoring_time) < max_monitoring_time
+            ):
+                # Sleep until the ticker reports a new tick
+                try:
+                    await asyncio.wait_for(tick_event.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    continue
+                tick_event.clear()
+
+                # Check if we still have a position
+                item = portfolio_by_symbol.get(symbol)
+                if item is not None:
+                    position_size = item.position
+                    if sign * position_size <= 0:
+                        await ws.send_json(
+                            {
+                                "type": "3r_trade_update",
+                                "status": "Closed",
+                                "message": f"Position closed. Final size: {position_size}",
+                            }
+                        )
+                        return  # Exit the function if the position is closed
+
+                # Get latest price; ticks without a trade price carry nothing to act on
+                current_price = ticker.last
+                if not current_price or math.isnan(current_price):
+                    continue
+
+                try:
+                    logger.debug("Current price: %s", current_price)
+
+                    # Send price update periodically (not every tick to avoid flooding)
+                    if time.time() - last_price_update >= 10:  # Every 10 seconds
+                        last_price_update = time.time()
                         await ws.send_json(
                             {
                                 "type": "3r_trade_update",
@@ -389,14 +610,12 @@ async def manage_3r_trade(
                             }
                         )
 
+                    targets_reached = int(
+                        np.searchsorted(targets, sign * current_price, side="right")
+                    )
+
                     # First partial take profit
-                    if not first_partial and (
-                        (
-                            current_price >= partial1_target
-                            if direction == "long"
-                            else current_price <= partial1_target
-                        )
-                    ):
+                    if stage == 0 and targets_reached > 0:
                         logger.info("First partial take profit target hit.")
                         await ws.send_json(
                             {
@@ -407,8 +626,9 @@ async def manage_3r_trade(
                         )
 
                         # Take partial of partial_size shares
-                        partial_action = "SELL" if direction == "long" else "BUY"
-                        partial_order1 = MarketOrder(partial_action, partial_size)
+                        partial_order1 = dataclasses.replace(
+                            market_exit, totalQuantity=partial_size
+                        )
                         ib.placeOrder(stock, partial_order1)
                         ib.cancelOrder(stop_loss_order)  # Remove initial stop
 
@@ -422,9 +642,10 @@ async def manage_3r_trade(
 
                         # Adjust stop to break-even
                         new_stop_price = entry_price
-                        stop_action = "SELL" if direction == "long" else "BUY"
-                        break_even_stop = StopOrder(
-                            stop_action, share_size - partial_size, new_stop_price
+                        break_even_stop = dataclasses.replace(
+                            stop_exit,
+                            totalQuantity=share_size - partial_size,
+                            auxPrice=new_stop_price,
                         )
                         ib.placeOrder(stock, break_even_stop)
 
@@ -438,20 +659,10 @@ async def manage_3r_trade(
                         )
 
                         remaining_shares -= partial_size
-                        first_partial = True
+                        stage = 1
 
                     # Second partial take profit
-                    if (
-                        first_partial
-                        and not second_partial
-                        and (
-                            (
-                                current_price >= partial2_target
-                                if direction == "long"
-                                else current_price <= partial2_target
-                            )
-                        )
-                    ):
+                    if stage == 1 and targets_reached > 1:
                         logger.info("Second partial take profit target hit.")
                         await ws.send_json(
                             {
@@ -462,8 +673,9 @@ async def manage_3r_trade(
                         )
 
                         # Take another partial of partial_size shares
-                        partial_action = "SELL" if direction == "long" else "BUY"
-                        partial_order2 = MarketOrder(partial_action, partial_size)
+                        partial_order2 = dataclasses.replace(
+                            market_exit, totalQuantity=partial_size
+                        )
                         ib.placeOrder(stock, partial_order2)
 
                         if break_even_stop:
@@ -479,11 +691,10 @@ async def manage_3r_trade(
 
                         # Set trailing stop for remaining shares
                         trail_amount = R / 2  # Set trailing amount to half of R
-                        trailing_action = "SELL" if direction == "long" else "BUY"
-                        trailing_stop_order = await create_trailing_stop_order(
-                            trailing_action,
-                            remaining_shares - partial_size,
-                            trail_amount,
+                        trailing_stop_order = dataclasses.replace(
+                            trailing_exit,
+                            totalQuantity=remaining_shares - partial_size,
+                            auxPrice=trail_amount,  # This sets the trailing amount
                         )
                         ib.placeOrder(stock, trailing_stop_order)
 
@@ -496,13 +707,13 @@ async def manage_3r_trade(
                         )
 
                         remaining_shares -= partial_size
-                        second_partial = True
-
-            except Exception as e:
-                logger.error(f"Error getting price data: {e}")
+                        stage = 2
 
-            # Sleep before next check
-            await asyncio.sleep(5)
+                except Exception as e:
+                    logger.error("Error getting price data: %s", e)
+        finally:
+            ticker.updateEvent -= on_tick
+            ib.updatePortfolioEvent -= on_portfolio
 
         # If we exit the loop normally, the trade is still open with trailing stops
         await ws.send_json(
@@ -514,7 +725,7 @@ async def manage_3r_trade(
         )
 
     except Exception as e:
-        logger.error(f"Error managing 3R trade: {e}")
+        logger.error("Error managing 3R trade: %s", e)
         await ws.send_json(
             {"type": "error", "message": f"Error in trade management: {e}"}
         )
@@ -891,8 +1102,20 @@ async def websocket_handler(request):
                         elif tradeType == "3r_volatility":
                             timeframe = int(data.get("timeframe", 5))
                             lookback = int(data.get("lookback", 20))
-                            await enter_3r_trade(
-                                ws, symbol, direction, quantity, timeframe, lookback
+                            # "wilder" smooths the ATR with Wilder's RMA
+                            smoothing = data.get("smoothing", "sma")
+                            # Runs for the life of the trade, so keep it off
+                            # the message loop
+                            spawn_background_task(
+                                enter_3r_trade(
+                                    ws,
+                                    symbol,
+                                    direction,
+                                    quantity,
+                                    timeframe,
+                                    lookback,
+                                    smoothing,
+                                )
                             )
 
                     elif data["type"] == "positions":